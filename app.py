@@ -1,17 +1,99 @@
-import datetime
 import time
+# بداية قياس زمن الإقلاع (قبل بقية الاستيرادات عمداً)
+_BOOT_STARTED = time.perf_counter()
+
+import atexit
+import bisect
+import datetime
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import threading
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+import weakref
+from contextlib import contextmanager
+import click
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, g,
+                   stream_with_context)
+from jinja2 import FileSystemBytecodeCache
+from events import EventBroker
+from caching import FragmentCache, ResponseCache, slot_marker, splice
+from pipeline import OrderPipeline
+from facets import PRICE_BANDS, FacetIndex, band_label, bands_between, iter_positions, price_band
+from search import SearchIndex, Typeahead
+from storage import MemoryStorage, create_storage
+
+# ==============================================================================
+#                       زمن الإقلاع (Cold Start Budget)
+# ==============================================================================
+# الآلات تتوقف عند الخمول، فأول طلب بعد الاستيقاظ يدفع الإقلاع كله:
+# المفسر، الاستيرادات، إعداد Flask، تحميل الحالة، وترجمة القوالب.
+# نقيس كل مرحلة حتى أول بايت من أول رد ونقارنه بميزانية SHOP_STARTUP_BUDGET_MS.
+
+STARTUP_BUDGET_MS = float(os.environ.get('SHOP_STARTUP_BUDGET_MS', 1000))
+STARTUP = {'phases': {}, 'first_byte_ms': None, 'budget_ms': STARTUP_BUDGET_MS}
+
+def _process_age_ms():
+    # عمر العملية قبل تحميل هذه الوحدة (إقلاع المفسر)، متاح على Linux فقط
+    try:
+        with open('/proc/self/stat') as f:
+            started_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, (uptime - started_ticks / os.sysconf('SC_CLK_TCK')) * 1000)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _mark(phase, since):
+    now = time.perf_counter()
+    STARTUP['phases'][phase] = round((now - since) * 1000, 2)
+    return now
+
+_interpreter_ms = _process_age_ms()
+if _interpreter_ms is not None:
+    STARTUP['phases']['interpreter'] = round(max(0.0, _interpreter_ms - (time.perf_counter() - _BOOT_STARTED) * 1000), 2)
+_t = _mark('imports', _BOOT_STARTED)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production-please-use-env-variable')
 
+# القوالب المترجمة تُحفظ على القرص فلا يعيد أول عرض بعد الاستيقاظ ترجمتها
+_jinja_cache_dir = os.environ.get('SHOP_JINJA_CACHE', os.path.join(app.instance_path, 'jinja-cache'))
+try:
+    os.makedirs(_jinja_cache_dir, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(_jinja_cache_dir))
+except OSError:
+    pass
+_t = _mark('app', _t)
+
 # ==============================================================================
 #                               1. الكيانات (Classes)
 # ==============================================================================
 
+class Pricing:
+    # تسعير المنتج محسوب مرة واحدة: السعر الفعلي وعلامات العرض ونصوص العرض
+    # يُعاد حسابه فقط عند تغير السعر أو العرض (انظر Product.pricing)
+    __slots__ = ('unit_price', 'new_price', 'has_discount', 'has_offer',
+                 'price_label', 'new_price_label', 'discount_label')
+
+    def __init__(self, price, discount, gift):
+        self.has_discount = discount > 0
+        self.has_offer = self.has_discount or bool(gift)
+        self.unit_price = price - (price * discount / 100) if self.has_discount else price
+        self.new_price = round(self.unit_price, 2)
+        self.price_label = f"{price}$"
+        self.new_price_label = f"{self.new_price}$"
+        self.discount_label = f"خصم {discount}%" if self.has_discount else ""
+
 class Product:
     def __init__(self, p_id, name, price, stock, category):
+        self._pricing = None
+        self.version = 0      # يزيد مع كل تعديل يمر على ProductCatalog.reindex
+        self.modified = None  # وقت آخر تعديل (Last-Modified)
         self.id = p_id
         self.name = name
         self.price = price
@@ -28,8 +110,51 @@ class Product:
         self.offer_gift = gift_name
         self.offer_limit = limit
 
+    # مدخلات التسعير: أي تغيير فيها يُسقط التسعير المحفوظ
+    @property
+    def price(self):
+        return self._price
+
+    @price.setter
+    def price(self, value):
+        self._price = value
+        self._pricing = None
+
+    @property
+    def offer_discount(self):
+        return self._offer_discount
+
+    @offer_discount.setter
+    def offer_discount(self, value):
+        self._offer_discount = value
+        self._pricing = None
+
+    @property
+    def offer_gift(self):
+        return self._offer_gift
+
+    @offer_gift.setter
+    def offer_gift(self, value):
+        self._offer_gift = value
+        self._pricing = None
+
+    @property
+    def pricing(self):
+        pricing = self._pricing
+        if pricing is None:
+            pricing = self._pricing = Pricing(self._price, self._offer_discount, self._offer_gift)
+        return pricing
+
+    @property
+    def has_offer(self):
+        return self.pricing.has_offer
+
+    @property
+    def effective_price(self):
+        return self.pricing.unit_price
+
     def to_dict(self):
-        new_price = self.price - (self.price * self.offer_discount / 100) if self.offer_discount > 0 else self.price
+        pricing = self.pricing
         return {
             'id': self.id,
             'name': self.name,
@@ -39,10 +164,32 @@ class Product:
             'offer_discount': self.offer_discount,
             'offer_gift': self.offer_gift,
             'offer_limit': self.offer_limit,
-            'new_price': round(new_price, 2),
-            'has_offer': self.offer_discount > 0 or self.offer_gift is not None
+            'new_price': pricing.new_price,
+            'has_offer': pricing.has_offer
         }
 
+    def to_row(self):
+        return {
+            'id': self.id, 'name': self.name, 'price': self.price, 'stock': self.stock,
+            'category': self.category, 'offer_discount': self.offer_discount,
+            'offer_gift': self.offer_gift, 'offer_limit': self.offer_limit,
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        p = cls(row['id'], row['name'], row['price'], row['stock'], row['category'])
+        p.set_offer(row['offer_discount'], row['offer_gift'], row['offer_limit'])
+        return p
+
+    def update_from_row(self, row):
+        # يعيد True إذا تغير شيء فعلاً
+        changed = False
+        for key in ('name', 'price', 'stock', 'category', 'offer_discount', 'offer_gift', 'offer_limit'):
+            if getattr(self, key) != row[key]:
+                setattr(self, key, row[key])
+                changed = True
+        return changed
+
     def get_admin_row(self):
         offer_parts = []
         if self.offer_discount > 0: offer_parts.append(f"خصم {self.offer_discount}%")
@@ -52,39 +199,557 @@ class Product:
         offer_txt = " ".join(offer_parts) if offer_parts else "---"
         return f"{self.id:<5} | {self.name:<22} | {self.price:<8} | {self.stock:<8} | {offer_txt}"
 
+class ProductCatalog:
+    # مخزن المنتجات: فهرس أساسي بالـ id وفهارس ثانوية (التصنيف، فئة السعر، المتوفر، العروض، الهدايا)
+    # الفهارس الثانوية خرائط بتات على مواقع المنتجات (انظر facets.py)، لذلك تحافظ على ترتيب الإدراج
+    def __init__(self):
+        self._items = []      # المنتجات بترتيب الإدراج (للعرض كقائمة)
+        self._by_id = {}      # id -> Product
+        self._pos = {}        # id -> موقع المنتج في _items
+        self._keys = {}       # id -> (التصنيف، عليه عرض، متوفر، الاسم، فئة السعر، هدية) كما فُهرس آخر مرة
+        self.version = 0      # يزيد مع كل إضافة/تعديل (مفتاح كاش الصفحات و ETag)
+        self.modified = time.time()
+        self._facets = FacetIndex()
+        self._search = SearchIndex()   # بحث نصي بالاسم والتصنيف (انظر search.py)
+        self.typeahead = Typeahead()   # إكمال تلقائي مرتب بالمبيعات
+        self._watchers = []            # تُستدعى مع كل منتج يُعاد فهرسته (التحديثات الحية)
+        # قفل قصير لصيانة الفهارس فقط؛ حجز المخزون له أقفاله الخاصة (StockReserver)
+        self._lock = threading.RLock()
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, p_id):
+        return p_id in self._by_id
+
+    def add(self, product):
+        with self._lock:
+            if product.id in self._by_id:
+                raise ValueError(f"Duplicate product id: {product.id}")
+            self._pos[product.id] = len(self._items)
+            self._items.append(product)
+            self._by_id[product.id] = product
+            self._reindex(product)
+            self.version += 1
+            self.modified = product.modified
+        return product
+
+    def get(self, p_id):
+        return self._by_id.get(p_id)
+
+    def watch(self, callback):
+        self._watchers.append(callback)
+
+    def reindex(self, product):
+        # يُستدعى بعد أي تعديل على المنتج (تعديل إداري، عرض، خصم مخزون)
+        with self._lock:
+            self._reindex(product)
+            self.version += 1
+            self.modified = product.modified
+
+    def reindex_many(self, products):
+        # للتعديلات الجماعية: قفل واحد ومرور واحد على المنتجات المتغيرة وزيادة واحدة للإصدار
+        with self._lock:
+            for product in products:
+                self._reindex(product)
+            self.version += 1
+            self.modified = time.time()
+
+    def _reindex(self, product):
+        product.version += 1
+        product.modified = time.time()
+        for watcher in self._watchers:
+            watcher(product)
+        pos = self._pos[product.id]
+        old = self._keys.get(product.id)
+        new = (product.category, product.has_offer, product.stock > 0, product.name,
+               price_band(product.effective_price), bool(product.offer_gift))
+        if old == new:
+            return
+        if old is None or old[0] != new[0] or old[3] != new[3]:
+            self._search.update(pos, product.name, product.category)
+        if old is None or old[3] != new[3]:
+            self.typeahead.update(product.id, product.name)
+        self._facets.update(pos, new[0], new[4], new[2], new[1], new[5])
+        self._keys[product.id] = new
+
+    def categories(self):
+        return self._facets.categories()
+
+    def by_category(self, category):
+        return self._resolve(iter_positions(self._facets.category(category)))
+
+    def with_offers(self):
+        return self._resolve(iter_positions(self._facets.flag('has_offer')))
+
+    def in_stock(self):
+        return self._resolve(iter_positions(self._facets.flag('in_stock')))
+
+    @staticmethod
+    def _selection(category, offers_only, in_stock_only, has_gift, min_price, max_price, price_band):
+        # الفلاتر بصيغة FacetIndex: المدى [min_price, max_price] يصبح فئات سعر متقاطعة معه
+        bands = None
+        if min_price is not None or max_price is not None:
+            bands = bands_between(min_price, max_price)
+        if price_band is not None:
+            bands = [price_band] if bands is None or price_band in bands else []
+        return {'category': category, 'bands': bands, 'in_stock': in_stock_only,
+                'has_offer': offers_only, 'has_gift': has_gift}
+
+    def page(self, category=None, offers_only=False, in_stock_only=False, has_gift=False,
+             min_price=None, max_price=None, price_band=None, after=None, limit=24):
+        # صفحة من المنتجات بعد المؤشر `after` (موقع آخر منتج في الصفحة السابقة)
+        # الفلاتر AND بين خرائط البتات؛ يبقى فحص حدود السعر الدقيقة على المرشحين فقط
+        # يعيد (منتجات الصفحة، مؤشر الصفحة التالية أو None)
+        bitmap = self._facets.select(**self._selection(
+            category, offers_only, in_stock_only, has_gift, min_price, max_price, price_band))
+        exact_price = min_price is not None or max_price is not None
+        page = []
+        last = None
+        for pos in iter_positions(bitmap, 0 if after is None else max(0, after + 1)):
+            p = self._items[pos]
+            if exact_price and not ((min_price is None or p.effective_price >= min_price)
+                                    and (max_price is None or p.effective_price <= max_price)):
+                continue
+            if len(page) == limit:
+                return page, last
+            page.append(p)
+            last = pos
+        return page, None
+
+    def facet_counts(self, category=None, offers_only=False, in_stock_only=False, has_gift=False,
+                     min_price=None, max_price=None, price_band=None):
+        # عدد المنتجات لكل قيمة فلتر (لعرضه بجانب الفلاتر)؛ حدود السعر هنا بدقة فئات السعر
+        return self._facets.counts(**self._selection(
+            category, offers_only, in_stock_only, has_gift, min_price, max_price, price_band))
+
+    def search(self, query, category=None, offers_only=False, in_stock_only=False, has_gift=False,
+               min_price=None, max_price=None, price_band=None, offset=0, limit=24):
+        # نتائج البحث مرتبة بالصلة مع نفس فلاتر page؛ المؤشر هنا إزاحة في النتائج
+        # الفلاتر خريطة بتات تُقاطع مع كلمات البحث، ويبقى فحص حدود السعر الدقيقة
+        # على المواقع التي تصلها الصفحة فقط كما في page
+        selection = self._selection(category, offers_only, in_stock_only, has_gift, min_price, max_price, price_band)
+        filtered = selection['category'] is not None or selection['bands'] is not None or any(
+            selection[flag] for flag in ('in_stock', 'has_offer', 'has_gift'))
+        accept = None
+        if min_price is not None or max_price is not None:
+            items = self._items
+
+            def accept(pos):
+                price = items[pos].effective_price
+                return (min_price is None or price >= min_price) and (max_price is None or price <= max_price)
+        positions, next_offset = self._search.search(
+            query, offset=offset, limit=limit,
+            candidates=self._facets.select(**selection) if filtered else None, accept=accept)
+        return self._resolve(positions), next_offset
+
+    def _resolve(self, positions):
+        return [self._items[i] for i in positions]
+
+class CartLine:
+    __slots__ = ('product', 'qty', 'unit_price', 'subtotal', 'discount', 'total')
+
+    def __init__(self, product, qty):
+        self.product = product
+        self.qty = qty
+        self.price()
+
+    def price(self):
+        p = self.product
+        self.unit_price = p.pricing.unit_price
+        self.subtotal = p.price * self.qty
+        self.total = self.unit_price * self.qty
+        self.discount = self.subtotal - self.total
+
+class Cart:
+    # سلة مفهرسة بالمنتج: إضافة نفس المنتج تجمع الكمية في سطر واحد،
+    # والمجاميع تُحدَّث مع كل إضافة/حذف/تغيير عرض بدل إعادة تسعير السلة كلها
+    def __init__(self, holders=None):
+        self._lines = {}          # product_id -> CartLine
+        self._holders = holders   # product_id -> السلال التي تحتوي المنتج (لإعادة التسعير)
+        self.subtotal = 0
+        self.discount_total = 0
+        self.modified = time.time()   # آخر إضافة/حذف (Last-Modified للصفحات)
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __contains__(self, p_id):
+        return p_id in self._lines
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount_total
+
+    def qty_of(self, p_id):
+        line = self._lines.get(p_id)
+        return line.qty if line else 0
+
+    def add(self, product, qty):
+        line = self._lines.get(product.id)
+        if line:
+            self._untally(line)
+            line.qty += qty
+            line.price()
+        else:
+            line = self._lines[product.id] = CartLine(product, qty)
+            if self._holders is not None:
+                self._holders.setdefault(product.id, weakref.WeakSet()).add(self)
+        self._tally(line)
+        self.modified = time.time()
+        return line
+
+    def remove(self, p_id):
+        line = self._lines.pop(p_id, None)
+        if line:
+            self._release(p_id)
+            if self._lines:
+                self._untally(line)
+            else:
+                # سلة فارغة: نصفّر المجاميع بدل تراكم أخطاء الفاصلة العائمة
+                self.subtotal = 0
+                self.discount_total = 0
+            self.modified = time.time()
+        return line
+
+    def clear(self):
+        for p_id in list(self._lines):
+            self._release(p_id)
+        self._lines.clear()
+        self.subtotal = 0
+        self.discount_total = 0
+        self.modified = time.time()
+
+    def reprice(self, product):
+        line = self._lines.get(product.id)
+        if line:
+            self._untally(line)
+            line.price()
+            self._tally(line)
+
+    def lines(self):
+        return [[p_id, line.qty] for p_id, line in list(self._lines.items())]
+
+    def _tally(self, line):
+        self.subtotal += line.subtotal
+        self.discount_total += line.discount
+
+    def _untally(self, line):
+        self.subtotal -= line.subtotal
+        self.discount_total -= line.discount
+
+    def _release(self, p_id):
+        if self._holders is not None and p_id in self._holders:
+            self._holders[p_id].discard(self)
+
 class User:
-    def __init__(self, username, password, role="Customer"):
+    def __init__(self, username, password, role="Customer", cart=None):
         self.username = username
         self.password = password
         self.role = role
-        self.cart = []
+        self.cart = cart if cart is not None else Cart()
+
+    def cart_lines(self):
+        return self.cart.lines()
+
+    def to_row(self):
+        return {'username': self.username, 'password': self.password, 'role': self.role, 'cart': self.cart_lines()}
+
+class StockReserver:
+    # حجز مخزون عدة منتجات دفعة واحدة: الكل أو لا شيء
+    # الأقفال مقسمة حسب المنتج (lock striping) فلا تنتظر عمليات شراء لمنتجات مختلفة بعضها،
+    # وتؤخذ دائماً بترتيب تصاعدي لأرقام الأقفال فلا يمكن أن يحدث جمود (deadlock)
+    def __init__(self, catalog, storage, stripes=64):
+        self._catalog = catalog
+        self._storage = storage
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    @contextmanager
+    def locked(self, p_ids):
+        stripes = sorted({hash(p_id) % len(self._locks) for p_id in p_ids})
+        for i in stripes:
+            self._locks[i].acquire()
+        try:
+            yield
+        finally:
+            for i in reversed(stripes):
+                self._locks[i].release()
+
+    @contextmanager
+    def reserve(self, needed, label=None):
+        # needed: {product_id: qty}. القيمة المُعادة True إذا حُجزت كل الكميات
+        # ما يُكتب داخل الكتلة يدخل في نفس معاملة التخزين، وأي استثناء يعيد المخزون
+        with self.locked(needed), self._storage.batch(label):
+            previous = {p_id: self._catalog.get(p_id).stock for p_id in needed}
+            stocks = self._take(needed)
+            if stocks is None:
+                yield False
+                return
+            self._set_stock(stocks)
+            try:
+                yield True
+            except BaseException:
+                self._set_stock(previous)
+                raise
+
+    def _take(self, needed):
+        # التخزين المشترك هو المرجع للمخزون: خصم ذري مشروط في قاعدة البيانات
+        if self._storage.shared:
+            return self._storage.reserve_stock(sorted(needed.items()))
+        stocks = {}
+        for p_id, qty in needed.items():
+            stock = self._catalog.get(p_id).stock
+            if qty > stock: return None
+            stocks[p_id] = stock - qty
+        for p_id, stock in stocks.items():
+            self._storage.update_product(p_id, {'stock': stock})
+        return stocks
+
+    def release(self, needed):
+        # عكس reserve لطلب أُلغي بعد الحجز؛ يُستدعى تحت locked(needed) وداخل دفعة التخزين
+        if self._storage.shared:
+            stocks = self._storage.release_stock(sorted(needed.items()))
+        else:
+            stocks = {p_id: self._catalog.get(p_id).stock + qty for p_id, qty in needed.items()}
+            for p_id, stock in stocks.items():
+                self._storage.update_product(p_id, {'stock': stock})
+        self._set_stock(stocks)
+
+    def _set_stock(self, stocks):
+        for p_id, stock in stocks.items():
+            prod = self._catalog.get(p_id)
+            prod.stock = stock
+            self._catalog.reindex(prod)
+
+class IdAllocator:
+    # أرقام فريدة بين العمليات وعبر إعادة التشغيل: كل عملية تحجز من العداد المحفوظ في
+    # التخزين كتلة بحجم block_size وتوزعها محلياً، فلا يلمس التخزين إلا رقم من كل كتلة.
+    # التوزيع بـ itertools.count (ذري تحت الـ GIL) فلا قفل في المسار العادي، والكتلة
+    # مشتركة بين خيوط العملية لأن greenlets عامل gevent كانت ستهدر كتلة لكل طلب.
+    # الأرقام تزيد دائماً داخل العملية، وما لم يُستعمل من كتلة عند الإيقاف يبقى فجوة.
+    def __init__(self, storage, name, block_size=100, floor=None):
+        self._storage = storage
+        self.name = name
+        self.block_size = block_size
+        self._floor = floor           # دالة تعطي أقل رقم مسموح (بيانات أقدم من العداد)
+        self._block = (iter(()), 0)   # (العداد المحلي، نهاية الكتلة)
+        self._lock = threading.Lock()
+
+    def next(self):
+        while True:
+            block = self._block
+            value = next(block[0], None)
+            if value is not None and value < block[1]:
+                return value
+            with self._lock:
+                if self._block is block:
+                    floor = self._floor() if self._floor else 1
+                    start = self._storage.allocate_ids(self.name, self.block_size, floor)
+                    self._block = (itertools.count(start), start + self.block_size)
+
+class UserRegistry:
+    # سجل المستخدمين بالاسم: بحث وتسجيل مباشر بدل المرور على كل المستخدمين
+    def __init__(self):
+        self._by_name = {}
+
+    def __iter__(self):
+        return iter(list(self._by_name.values()))
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, username):
+        return username in self._by_name
+
+    def get(self, username):
+        return self._by_name.get(username)
+
+    def add(self, user):
+        if user.username in self._by_name:
+            raise ValueError(f"Duplicate username: {user.username}")
+        self._by_name[user.username] = user
+        return user
 
 class Order:
-    def __init__(self, order_id, customer, items, total, address, pay_method, pay_status):
+    def __init__(self, order_id, customer, items, total, address, pay_method, pay_status, lines=None):
         self.order_id = order_id
         self.customer_name = customer
         self.items_txt = items
+        self.lines = lines or []   # [[product_id, qty], ...]
         self.total = total
         self.address = address
         self.pay_method = pay_method
         self.pay_status = pay_status
         self.date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
 
+    def to_row(self):
+        return {
+            'order_id': self.order_id, 'customer': self.customer_name, 'items': self.items_txt,
+            'total': self.total, 'address': self.address, 'pay_method': self.pay_method,
+            'pay_status': self.pay_status, 'date': self.date, 'lines': self.lines,
+        }
+
+    @property
+    def day(self):
+        return self.date[:10]
+
+    def to_dict(self):
+        return {
+            'order_id': self.order_id, 'customer': self.customer_name, 'items': self.items_txt,
+            'total': round(self.total, 2), 'address': self.address, 'pay_method': self.pay_method,
+            'pay_status': self.pay_status, 'date': self.date,
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        o = cls(row['order_id'], row['customer'], row['items'], row['total'],
+                row['address'], row['pay_method'], row['pay_status'], row.get('lines'))
+        o.date = row['date']
+        return o
+
+class OrderLedger:
+    # سجل الطلبات بترتيب الإضافة مع فهارس حسب اليوم والعميل وحالة الدفع وطريقة الدفع
+    # كل فهرس قائمة مرتبة بأرقام التسلسل، والاستعلام يعرض الأحدث أولاً بمؤشر صفحات
+    def __init__(self):
+        self._orders = []       # seq -> Order
+        self._by_id = {}        # order_id -> Order
+        self._by_day = {}       # 'YYYY-MM-DD' -> [seq]
+        self._days = []         # الأيام مرتبة (لاستعلامات المدى)
+        self._by_customer = {}
+        self._by_status = {}
+        self._by_method = {}
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(self._orders)
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._by_id
+
+    def get(self, order_id):
+        return self._by_id.get(order_id)
+
+    def add(self, order):
+        with self._lock:
+            if order.order_id in self._by_id:
+                return False
+            seq = len(self._orders)
+            self._orders.append(order)
+            self._by_id[order.order_id] = order
+            if order.day not in self._by_day:
+                bisect.insort(self._days, order.day)
+            self._insert(self._by_day.setdefault(order.day, []), seq)
+            self._insert(self._by_customer.setdefault(order.customer_name, []), seq)
+            self._insert(self._by_status.setdefault(order.pay_status, []), seq)
+            self._insert(self._by_method.setdefault(order.pay_method, []), seq)
+        return True
+
+    def pay_statuses(self):
+        return list(self._by_status)
+
+    def pay_methods(self):
+        return list(self._by_method)
+
+    def query(self, day=None, date_from=None, date_to=None, customer=None, pay_status=None,
+              unpaid=False, pay_method=None, before=None, limit=50):
+        # يعيد (طلبات الصفحة من الأحدث للأقدم، مؤشر الصفحة التالية أو None)
+        if day is not None:
+            date_from = date_to = day
+        sources = []
+        if date_from is not None or date_to is not None:
+            lo = bisect.bisect_left(self._days, date_from) if date_from else 0
+            hi = bisect.bisect_right(self._days, date_to) if date_to else len(self._days)
+            sources.append([self._by_day[d] for d in self._days[lo:hi]])
+        if customer is not None:
+            sources.append([self._by_customer.get(customer, [])])
+        if pay_status is not None:
+            sources.append([self._by_status.get(pay_status, [])])
+        elif unpaid:
+            sources.append([seqs for status, seqs in self._by_status.items() if status != "Paid"])
+        if pay_method is not None:
+            sources.append([self._by_method.get(pay_method, [])])
+        if not sources:
+            sources.append([range(len(self._orders))])
+        lists = min(sources, key=lambda ls: sum(len(l) for l in ls))
+
+        def matches(o):
+            return ((date_from is None or o.day >= date_from)
+                    and (date_to is None or o.day <= date_to)
+                    and (customer is None or o.customer_name == customer)
+                    and (pay_status is None or o.pay_status == pay_status)
+                    and (not unpaid or o.pay_status != "Paid")
+                    and (pay_method is None or o.pay_method == pay_method))
+
+        end = len(self._orders) if before is None else before
+        newest_first = heapq.merge(*[reversed(l[:bisect.bisect_left(l, end)]) for l in lists], reverse=True)
+        page = []
+        for seq in newest_first:
+            o = self._orders[seq]
+            if not matches(o):
+                continue
+            if len(page) == limit:
+                return page, last
+            page.append(o)
+            last = seq
+        return page, None
+
+    @staticmethod
+    def _insert(seqs, seq):
+        # الطلبات تُضاف بتسلسل متزايد، فالإضافة عادة في آخر القائمة
+        if not seqs or seqs[-1] < seq:
+            seqs.append(seq)
+        else:
+            bisect.insort(seqs, seq)
+
 # ==============================================================================
 #                           2. نظام التحكم (Controller)
 # ==============================================================================
 
 class ShopSystem:
-    def __init__(self):
-        self.products = []
-        self.users = []
-        self.orders = []
-        # الحسابات: (admin/123) و (place/123)
-        self.users.append(User("place", "123", "Admin"))
-        self.users.append(User("admin", "123", "Admin"))
-        self._seed_data()
+    def __init__(self, storage=None, order_workers=0, max_pending_orders=1000, order_id_block=100):
+        self.storage = storage or MemoryStorage()
+        self.products = ProductCatalog()
+        self.users = UserRegistry()
+        self.stock = StockReserver(self.products, self.storage)
+        self.orders = OrderLedger()
+        self._cart_holders = {}   # product_id -> السلال التي تحتويه
+        self._max_order_id = 99
+        self._orders_lock = threading.Lock()
+        self.order_ids = IdAllocator(self.storage, 'order', block_size=order_id_block,
+                                     floor=lambda: self._max_order_id + 1)
+        self._rev = 0
+        self._sync_lock = threading.Lock()
+        # إنشاء الطلب وحفظه بعد حجز المخزون يجري في الخلفية (انظر pipeline.py)
+        self.pipeline = OrderPipeline(self._finalize_order, workers=order_workers, max_pending=max_pending_orders,
+                                      compensate=self._cancel_order)
+        self._pending = {}        # order_id -> صف طلب حُجز مخزونه ولم يُنشأ بعد
+
+        state = self.storage.load()
+        if state is None:
+            self._seed_data()
+            state = self.storage.seed(self.export_state())
+        if state is not None:
+            self._apply_state(state)
+        self.storage.bind(self.export_state)
+        # طلبات حُجز مخزونها في تشغيل سابق ولم تُنشأ قبل التوقف: تُكمل قبل استقبال الطلبات
+        for row in (state or {}).get('pending', ()):
+            self._pending[row['order_id']] = row
+            self.pipeline.recover(row['order_id'], row['customer'], row)
 
     def _seed_data(self):
+        # الحسابات: (admin/123) و (place/123)
+        self.users.add(self._new_user("place", "123", "Admin"))
+        self.users.add(self._new_user("admin", "123", "Admin"))
+
         # القائمة الكاملة (30 منتج)
         data = [
             (101, "Laptop HP Pavilion", 850, 10, "Electronics"),
@@ -119,43 +784,130 @@ class ShopSystem:
             (507, "Water Bottle", 12, 60, "Travel")
         ]
         for p in data:
-            self.products.append(Product(*p))
+            self.products.add(Product(*p))
+
+    # ------------------------- مزامنة التخزين المشترك -------------------------
+
+    def export_state(self):
+        return {
+            'rev': self._rev,
+            'products': [p.to_row() for p in self.products],
+            'users': [u.to_row() for u in self.users],
+            'orders': [o.to_row() for o in self.orders],
+            'pending': list(self._pending.values()),
+        }
+
+    def _apply_state(self, state):
+        # تطبيق صفوف قادمة من التخزين (تحميل أولي أو تغييرات عملية أخرى)
+        for row in state['products']:
+            p = self.products.get(row['id'])
+            if p is None:
+                self.products.add(Product.from_row(row))
+            elif p.update_from_row(row):
+                self.products.reindex(p)
+                self._reprice_carts(p)
+        for row in state['users']:
+            user = self.users.get(row['username'])
+            if user is None:
+                user = self.users.add(self._new_user(row['username'], row['password'], row['role']))
+            if user.cart.lines() != row['cart']:
+                user.cart.clear()
+                for p_id, qty in row['cart']:
+                    if p_id in self.products:
+                        user.cart.add(self.products.get(p_id), qty)
+        for row in state['orders']:
+            self._add_order(Order.from_row(row))
+        self._rev = max(self._rev, state['rev'])
+
+    def sync(self):
+        if not self.storage.shared: return
+        changes = self.storage.changes(self._rev)
+        if changes:
+            with self._sync_lock:
+                self._apply_state(changes)
+
+    def _add_order(self, order):
+        with self._orders_lock:
+            self._max_order_id = max(self._max_order_id, order.order_id)
+        if not self.orders.add(order):
+            return False
+        for p_id, qty in order.lines:
+            self.products.typeahead.add_sales(p_id, qty)
+        return True
+
+    def _next_order_id(self):
+        return self.order_ids.next()
+
+    def _new_user(self, u, p, role):
+        return User(u, p, role, Cart(self._cart_holders))
+
+    def _reprice_carts(self, product):
+        for cart in list(self._cart_holders.get(product.id, ())):
+            cart.reprice(product)
+
+    def save_cart(self, user):
+        self.storage.save_cart(user.username, user.cart_lines())
+
+    # ------------------------------- السلة -------------------------------
+
+    def cart_limits(self, user, product):
+        # (الكمية في السلة، الحد المسموح إضافته، المتبقي من حد العرض أو None)
+        current_in_cart = user.cart.qty_of(product.id)
+        max_allowed = product.stock
+        remaining_limit = None
+        if product.offer_limit > 0:
+            remaining_limit = product.offer_limit - current_in_cart
+            max_allowed = min(product.stock, remaining_limit)
+        return current_in_cart, max_allowed, remaining_limit
+
+    def add_to_cart(self, user, product, qty):
+        current_in_cart, max_allowed, remaining_limit = self.cart_limits(user, product)
+        if remaining_limit is not None and remaining_limit <= 0:
+            return False, f'لقد استهلكت الحد الأقصى لهذا العرض ({product.offer_limit} قطع)'
+        if qty <= 0 or qty > max_allowed:
+            return False, f'الكمية غير صحيحة. الحد المسموح: {max_allowed}'
+        with self.storage.batch('cart_add'):
+            user.cart.add(product, qty)
+            self.save_cart(user)
+        return True, f'تم إضافة {qty} من {product.name} بنجاح'
+
+    def remove_from_cart(self, user, p_id):
+        with self.storage.batch('cart_remove'):
+            if user.cart.remove(p_id):
+                self.save_cart(user)
 
     def login(self, u, p):
-        for user in self.users:
-            if user.username == u and user.password == p: return user
+        user = self.users.get(u)
+        if user and user.password == p: return user
         return None
 
+    def get_user(self, u):
+        return self.users.get(u)
+
     def register(self, u, p):
-        for user in self.users:
-            if user.username == u: return None
-        new_u = User(u, p, "Customer")
-        self.users.append(new_u)
-        return new_u
+        if u in self.users: return None
+        new_u = self._new_user(u, p, "Customer")
+        with self.storage.batch('register'):
+            # التخزين المشترك قد يعرف اسماً سجلته عملية أخرى قبل المزامنة
+            if not self.storage.add_user(new_u.to_row()): return None
+            return self.users.add(new_u)
 
     def get_product_by_id(self, p_id):
-        for p in self.products:
-            if p.id == p_id:
-                return p
-        return None
+        return self.products.get(p_id)
 
     def get_cart_total(self, user):
-        total = 0
-        for item in user.cart:
-            p = item['product']
-            price = p.price * item['qty']
-            if p.offer_discount > 0:
-                price -= price * (p.offer_discount / 100)
-            total += price
-        return total
-
-    def checkout(self, user, address, pay_method):
+        return user.cart.total
+
+    def checkout(self, user, address, pay_method, admit_timeout=0):
+        # يعيد (True, (رقم الطلب، المبلغ)) بعد الحجز؛ الطلب نفسه يُنشأ في الخلفية
         if not user.cart: return False, "السلة فارغة"
 
+        needed = {line.product.id: line.qty for line in user.cart}
+
         # تحقق أخير للأمان
-        for item in user.cart:
-            if item['qty'] > item['product'].stock:
-                return False, f"الكمية نفدت لـ {item['product'].name}"
+        out_of_stock = self._find_out_of_stock(user)
+        if out_of_stock:
+            return False, f"الكمية نفدت لـ {out_of_stock.name}"
 
         pay_status = "Pending"
         if pay_method == "Online Payment":
@@ -163,50 +915,377 @@ class ShopSystem:
         elif pay_method in ["Cash on Delivery", "Visa on Delivery"]:
             pay_status = "Upon Delivery"
 
-        items_report = []
-        final_total = 0
+        # مكان في طابور المعالجة قبل لمس المخزون، فالرفض عند الازدحام لا يحتاج تراجعاً
+        if not self.pipeline.admit(admit_timeout):
+            return False, "الخادم مشغول بطلبات أخرى، حاول بعد لحظات"
+        submitted = False
+        try:
+            # الرقم يُحجز قبل معاملة المخزون: كتلة جديدة من العداد لها معاملتها الخاصة
+            order_id = self._next_order_id()
+            with self.stock.reserve(needed, 'checkout') as reserved:
+                if reserved:
+                    # الطلب يُحفظ معلقاً في نفس دفعة الحجز، فتوقف العملية قبل إنشائه لا يضيعه
+                    order = Order(order_id, user.username, [f"{line.product.name} x{line.qty}" for line in user.cart],
+                                  user.cart.total, address, pay_method, pay_status, user.cart_lines())
+                    row = order.to_row()
+                    user.cart.clear()
+                    self.save_cart(user)
+                    self.storage.add_pending_order(row)
+                    self._pending[order_id] = row
+            if reserved:
+                self.pipeline.submit(order_id, user.username, row)
+                submitted = True
+        finally:
+            if not submitted:
+                self.pipeline.release()
+
+        if not reserved:
+            # سبقنا شراء آخر إلى المخزون: نحدّث الحالة لنعرف أي منتج نفد
+            self.sync()
+            out_of_stock = self._find_out_of_stock(user)
+            return False, f"الكمية نفدت لـ {out_of_stock.name}" if out_of_stock else "الكمية نفدت"
 
-        for item in user.cart:
-            prod = item['product']
-            qty = item['qty']
-            prod.stock -= qty
+        return True, (order_id, row['total'])
 
-            original_price = prod.price * qty
-            discount_val = 0
-            if prod.offer_discount > 0:
-                discount_val = original_price * (prod.offer_discount / 100)
-            final_item_price = original_price - discount_val
+    def _finalize_order(self, row):
+        # خطوة الخلفية: المخزون محجوز والطلب محفوظ معلقاً، يبقى إنشاؤه وفهرسته
+        # الإضافة إلى الذاكرة داخل الدفعة: اللقطة لا ترى سطر الطلب قبل أن تحويه الحالة
+        with self.storage.batch('order'):
+            if row['order_id'] not in self.orders and self.storage.add_order(row):
+                self._add_order(Order.from_row(row))
+            self._pending.pop(row['order_id'], None)
 
-            items_report.append(f"{prod.name} x{qty}")
-            final_total += final_item_price
+    def _cancel_order(self, row):
+        # تعويض طلب فشل إنشاؤه بعد كل المحاولات: يعود المخزون المحجوز والمنتجات إلى سلة صاحبها
+        needed = {p_id: qty for p_id, qty in row['lines'] if p_id in self.products}
+        with self.stock.locked(needed), self.storage.batch('cancel_order'):
+            # التخزين المشترك: عملية أخرى أنشأت الطلب أو ألغته قبلنا
+            if not self.storage.cancel_pending_order(row['order_id']):
+                return None
+            self._pending.pop(row['order_id'], None)
+            self.stock.release(needed)
+            user = self.users.get(row['customer'])
+            if user is not None:
+                for p_id, qty in needed.items():
+                    user.cart.add(self.products.get(p_id), qty)
+                self.save_cart(user)
+        return 'تعذر إنشاء الطلب، أُعيدت المنتجات إلى سلتك'
 
-        self.orders.append(Order(len(self.orders)+100, user.username, items_report, final_total, address, pay_method, pay_status))
-        user.cart.clear()
-        return True, final_total
+    def order_status(self, user, order_id):
+        # حالة الطلب لصاحبه فقط: من الطابور إذا كان قيد المعالجة، وإلا من سجل الطلبات
+        status = self.pipeline.status(order_id)
+        if status is not None and status['customer'] == user.username:
+            return {'order_id': order_id, 'state': status['state'], 'error': status['error']}
+        order = self.orders.get(order_id)
+        if order is not None and order.customer_name == user.username:
+            return {'order_id': order_id, 'state': 'done', 'error': None}
+        return None
+
+    def _find_out_of_stock(self, user):
+        for line in user.cart:
+            if line.qty > line.product.stock:
+                return line.product
+        return None
 
     def admin_edit_product(self, p_id, nn, np, ns):
-        for p in self.products:
-            if p.id == p_id:
-                if nn: p.name = nn
-                if np: p.price = float(np)
-                if ns: p.stock = int(ns)
-                return True
-        return False
+        p = self.products.get(p_id)
+        if not p: return False
+        # نفس قفل المنتج الذي يأخذه الشراء، فلا يضيع تعديل المخزون وسط عملية شراء
+        with self.stock.locked([p_id]), self.storage.batch('edit_product'):
+            if nn: p.name = nn
+            if np: p.price = float(np)
+            if ns: p.stock = int(ns)
+            fields = {}
+            if nn: fields['name'] = p.name
+            if np: fields['price'] = p.price
+            if ns: fields['stock'] = p.stock
+            self.storage.update_product(p_id, fields)
+            self.products.reindex(p)
+        if np: self._reprice_carts(p)
+        return True
 
-    def admin_apply_offer(self, p_id, d, g, l):
-        for p in self.products:
-            if p.id == p_id:
+    def admin_bulk_edit(self, edits):
+        # تعديلات كثيرة [{'product_id', 'name', 'price', 'stock'}] في مرور واحد:
+        # تحقق من كل سطر، ثم معاملة تخزين واحدة وإعادة فهرسة واحدة للمنتجات المتغيرة
+        # يعيد نتيجة لكل سطر بنفس الترتيب
+        results = []
+        staged = []
+        for edit in edits:
+            p_id = edit.get('product_id') if isinstance(edit, dict) else None
+            try:
+                p = self.products.get(int(p_id))
+            except (TypeError, ValueError):
+                p = None
+            if p is None:
+                results.append({'product_id': p_id, 'success': False, 'message': 'المنتج غير موجود'})
+                continue
+            fields = {}
+            try:
+                if edit.get('name'): fields['name'] = str(edit['name']).strip()
+                if edit.get('price') not in (None, ''): fields['price'] = float(edit['price'])
+                if edit.get('stock') not in (None, ''): fields['stock'] = int(edit['stock'])
+                # nan و inf تمر من float() ومن المقارنة بالصفر، ثم تفسد كل رد JSON فيه المنتج
+                price = fields.get('price', 0)
+                if not math.isfinite(price) or price < 0 or fields.get('stock', 0) < 0 or fields.get('name') == '':
+                    raise ValueError
+            except (TypeError, ValueError):
+                results.append({'product_id': p.id, 'success': False, 'message': 'قيمة غير صالحة'})
+                continue
+            staged.append((p, fields))
+            results.append({'product_id': p.id, 'success': True})
+        if not staged:
+            return results
+
+        with self.stock.locked([p.id for p, _ in staged]), self.storage.batch('bulk_edit'):
+            for p, fields in staged:
+                for key, value in fields.items():
+                    setattr(p, key, value)
+            self.storage.update_products([(p.id, fields) for p, fields in staged])
+            self.products.reindex_many(p for p, _ in staged)
+        for p, fields in staged:
+            if 'price' in fields: self._reprice_carts(p)
+        return results
+
+    def upsert_products(self, rows):
+        # استيراد دفعة صفوف (انظر catalog_io.py): الجديد يُضاف والموجود يُحدَّث،
+        # في معاملة تخزين واحدة مع قفل مخزون المنتجات الموجودة؛ يعيد (المضاف، المحدث)
+        existing = [row['id'] for row in rows if row['id'] in self.products]
+        created, changed = 0, []
+        with self.stock.locked(existing), self.storage.batch('import'):
+            self.storage.upsert_products(rows)
+            for row in rows:
+                p = self.products.get(row['id'])
+                if p is None:
+                    self.products.add(Product.from_row(row))
+                    created += 1
+                elif p.update_from_row(row):
+                    changed.append(p)
+            self.products.reindex_many(changed)
+        for p in changed:
+            self._reprice_carts(p)
+        return created, len(changed)
+
+    def admin_bulk_offer(self, d, g, l, category=None, product_ids=None):
+        # نفس العرض على تصنيف كامل أو قائمة منتجات في معاملة واحدة
+        if category is not None:
+            targets = self.products.by_category(category)
+            results = [{'product_id': p.id, 'success': True} for p in targets]
+        else:
+            targets = []
+            results = []
+            for p_id in product_ids or []:
+                p = self.products.get(p_id)
+                if p is None:
+                    results.append({'product_id': p_id, 'success': False, 'message': 'المنتج غير موجود'})
+                else:
+                    targets.append(p)
+                    results.append({'product_id': p.id, 'success': True})
+        if not targets:
+            return results
+        fields = {'offer_discount': d, 'offer_gift': g, 'offer_limit': l}
+        with self.storage.batch('bulk_offer'):
+            for p in targets:
                 p.set_offer(d, g, l)
-                return True
-        return False
+            self.storage.update_products([(p.id, fields) for p in targets])
+            self.products.reindex_many(targets)
+        for p in targets:
+            self._reprice_carts(p)
+        return results
+
+    def admin_apply_offer(self, p_id, d, g, l):
+        p = self.products.get(p_id)
+        if not p: return False
+        with self.storage.batch('apply_offer'):
+            p.set_offer(d, g, l)
+            self.storage.update_product(p_id, {'offer_discount': d, 'offer_gift': g, 'offer_limit': l})
+            self.products.reindex(p)
+            self._reprice_carts(p)
+        return True
 
 # Global shop system instance
-shop_system = ShopSystem()
+# SHOP_STORAGE=sqlite يجعل عدة عمليات gunicorn تتشارك نفس الحالة (انظر storage.py)
+# SHOP_STORAGE=journal يحفظ كل تغيير في سجل على القرص ويسترجعه عند التشغيل (انظر journal.py)
+# SHOP_ORDER_WORKERS عمال إنشاء الطلبات في الخلفية (0 = داخل طلب الشراء نفسه)
+shop_system = ShopSystem(create_storage(),
+                         order_workers=int(os.environ.get('SHOP_ORDER_WORKERS', 2)),
+                         max_pending_orders=int(os.environ.get('SHOP_ORDER_QUEUE', 1000)),
+                         order_id_block=int(os.environ.get('SHOP_ORDER_ID_BLOCK', 100)))
+atexit.register(shop_system.storage.close)
+# atexit بترتيب عكسي: الطابور يُفرَّغ قبل إغلاق التخزين
+atexit.register(shop_system.pipeline.drain)
+
+# التحديثات الحية (انظر events.py): ما يظهر في بطاقة المنتج وصف الإدارة فقط
+def _product_delta(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'new_price': product.pricing.new_price,
+        'stock': product.stock,
+        'discount': product.offer_discount,
+        'gift': product.offer_gift,
+        'limit': product.offer_limit,
+    }
+
+# مع التخزين المشترك يلتقط الخيط تغييرات العمليات الأخرى كل tick ما دام هناك مشتركون
+EVENTS = EventBroker(_product_delta, tick=float(os.environ.get('SHOP_EVENTS_TICK', 0.25)),
+                     poll=shop_system.sync if shop_system.storage.shared else None)
+shop_system.products.watch(EVENTS.publish)
+atexit.register(EVENTS.close)
+_t = _mark('state', _t)
 
 # ==============================================================================
 #                           3. Flask Routes
 # ==============================================================================
 
+@app.after_request
+def record_first_byte(response):
+    if STARTUP['first_byte_ms'] is None:
+        STARTUP['first_byte_ms'] = round((time.perf_counter() - _BOOT_STARTED) * 1000 + STARTUP['phases'].get('interpreter', 0), 2)
+        if STARTUP['first_byte_ms'] > STARTUP_BUDGET_MS:
+            app.logger.warning('startup over budget: %s', startup_report())
+    return response
+
+def startup_report():
+    return dict(STARTUP, over_budget=STARTUP['first_byte_ms'] is not None and STARTUP['first_byte_ms'] > STARTUP_BUDGET_MS)
+
+# ------------------------- كاش صفحات الكتالوج -------------------------
+# SHOP_PAGE_CACHE_SIZE عدد الصفحات المحفوظة (0 يلغي الكاش)، انظر caching.py
+PAGE_CACHE = ResponseCache(max_entries=int(os.environ.get('SHOP_PAGE_CACHE_SIZE', 512)))
+
+def _user_slots():
+    user = g.get('user')
+    return {'username': session.get('user', ''), 'cart_count': len(user.cart) if user else 0,
+            'event_id': EVENTS.last_event_id()}
+
+@app.template_global()
+def slot(name):
+    # داخل صفحة ستُحفظ في الكاش نضع علامة تُستبدل عند كل رد، وفي غيرها القيمة مباشرة
+    if g.get('caching_page'):
+        return slot_marker(name)
+    return _user_slots()[name]
+
+# ------------------------- ETag / Last-Modified -------------------------
+# التحقق مبني على عدادات الإصدار فيُجاب بـ 304 قبل أي عرض للقالب أو to_dict.
+# الإصدارات تبدأ من الصفر مع كل تشغيل (ولكل عامل)، فيدخل BOOT_ID في كل ETag.
+BOOT_ID = os.urandom(4).hex()
+
+def make_etag(version, *extra):
+    # extra: ما يعتمد عليه الرد غير الإصدار (المستخدم، الكمية في السلة)
+    digest = hashlib.blake2s(repr(extra).encode('utf-8'), digest_size=6).hexdigest() if extra else '0'
+    return f'{BOOT_ID}-{version}-{digest}'
+
+def not_modified(etag, modified):
+    # If-None-Match له الأولوية، و If-Modified-Since يُنظر فيه فقط عند غيابه
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    return since is not None and modified is not None and int(modified) <= since.timestamp()
+
+def with_validators(response, etag, modified):
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = datetime.datetime.fromtimestamp(int(modified), datetime.timezone.utc)
+    # الردود خاصة بالمستخدم: لا تُحفظ في الكاش المشترك ويُعاد التحقق منها كل مرة
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+def conditional(etag, modified, build):
+    if not_modified(etag, modified):
+        return with_validators(Response(status=304), etag, modified)
+    return with_validators(build(), etag, modified)
+
+def cached_page(view):
+    # الصفحة تُحفظ بمفتاح (المسار، الاستعلام، إصدار الكتالوج) وتُخدم لكل المستخدمين
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # الرسائل المؤقتة (flash) تُستهلك عند العرض، فلا نحفظ صفحة تحتويها
+        if 'user' not in session or session.get('_flashes'):
+            return view(*args, **kwargs)
+        catalog = shop_system.products
+        version = catalog.version
+        slots = _user_slots()
+        modified = max(catalog.modified, g.user.cart.modified) if g.user else catalog.modified
+        etag = make_etag(version, slots['username'], slots['cart_count'])
+        if not_modified(etag, modified):
+            return with_validators(Response(status=304), etag, modified)
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))), version)
+        body = PAGE_CACHE.get(key)
+        if body is None:
+            g.caching_page = True
+            try:
+                result = view(*args, **kwargs)
+            finally:
+                g.caching_page = False
+            if not isinstance(result, str):
+                return result
+            body = result.encode('utf-8')
+            PAGE_CACHE.put(key, body)
+        return with_validators(Response(splice(body, slots), mimetype='text/html'), etag, modified)
+    return wrapper
+
+# ------------------------- كاش أجزاء المنتجات -------------------------
+# بطاقة المنتج وصفّا الإدارة تُعرض من القالب مرة لكل إصدار من المنتج (انظر caching.py)
+# لا تستخدم هذه القوالب إلا product، فلا تعتمد على المستخدم أو الطلب
+FRAGMENT_TEMPLATES = {
+    'product_card': '_product_card.html',
+    'admin_stock_row': '_admin_stock_row.html',
+    'admin_offer_row': '_admin_offer_row.html',
+}
+FRAGMENTS = FragmentCache(enabled=os.environ.get('SHOP_FRAGMENT_CACHE', '1') != '0')
+
+@app.template_global()
+def fragment(kind, product):
+    template = app.jinja_env.get_template(FRAGMENT_TEMPLATES[kind])
+    return FRAGMENTS.render(kind, product.id, product.version, lambda: template.render(product=product))
+
+@app.route('/admin/cache_stats')
+def admin_cache_stats():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return jsonify({'success': False, 'message': 'غير مصرح'})
+    return jsonify({'success': True, 'catalog_version': shop_system.products.version,
+                    'pages': PAGE_CACHE.stats(), 'fragments': FRAGMENTS.stats(), 'events': EVENTS.stats()})
+
+# أقصى عمر لاتصال /api/stream قبل أن يعيد المتصفح الاتصال من حيث توقف
+STREAM_MAX_SECONDS = float(os.environ.get('SHOP_STREAM_MAX_SECONDS', 300))
+
+# أقصى عدد اتصالات بث مفتوحة في هذه العملية؛ فارغ = بلا حد (gevent و ASGI).
+# gunicorn.conf.py يضعه تحت عدد الخيوط مع gthread كي لا تحجز الصفحات المفتوحة كل الخيوط
+_stream_max = os.environ.get('SHOP_STREAM_MAX_CONNECTIONS', '')
+STREAM_SLOTS = threading.BoundedSemaphore(int(_stream_max)) if _stream_max else None
+
+def stream_params():
+    # (مسموح بالاشتراك، آخر حدث وصل للمتصفح)؛ يستخدمها وضع ASGI أيضاً (asgi.py)
+    return 'user' in session, request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+
+@app.route('/api/stream')
+def api_stream():
+    allowed, last_id = stream_params()
+    if not allowed:
+        return jsonify({'error': 'غير مصرح'})
+    if STREAM_SLOTS is not None and not STREAM_SLOTS.acquire(blocking=False):
+        # 204 يوقف EventSource عن إعادة الاتصال؛ الواجهة تحاول لاحقاً (main.js)
+        return Response(status=204)
+    response = Response(EVENTS.stream(last_id, max_age=STREAM_MAX_SECONDS), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'   # بدون تجميع في الـ proxy
+    if STREAM_SLOTS is not None:
+        response.call_on_close(STREAM_SLOTS.release)
+    return response
+
+@app.route('/healthz/startup')
+def startup_timings():
+    return jsonify(startup_report())
+
+@app.before_request
+def load_current_user():
+    # نلتقط تغييرات العمليات الأخرى ثم نحدد مستخدم الجلسة مرة واحدة لكل طلب
+    shop_system.sync()
+    username = session.get('user')
+    g.user = shop_system.get_user(username) if username else None
+
 @app.route('/')
 def index():
     return redirect(url_for('home'))
@@ -255,7 +1334,42 @@ def logout():
 def admin_dashboard():
     if 'user' not in session or session.get('role') != 'Admin':
         return redirect(url_for('login'))
-    return render_template('admin_dashboard.html', products=shop_system.products, orders=shop_system.orders)
+    orders, next_cursor = shop_system.orders.query(limit=ORDERS_PAGE_SIZE)
+    return render_template('admin_dashboard.html', products=shop_system.products, orders=orders,
+                           orders_count=len(shop_system.orders), next_orders_cursor=next_cursor,
+                           pay_statuses=shop_system.orders.pay_statuses(),
+                           pay_methods=shop_system.orders.pay_methods(),
+                           categories=shop_system.products.categories())
+
+ORDERS_PAGE_SIZE = 50
+
+def _order_filters():
+    day = request.args.get('day') or None
+    if day == 'today':
+        day = datetime.date.today().isoformat()
+    return {
+        'day': day,
+        'date_from': request.args.get('date_from') or None,
+        'date_to': request.args.get('date_to') or None,
+        'customer': request.args.get('customer') or None,
+        'pay_status': request.args.get('pay_status') or None,
+        'unpaid': request.args.get('unpaid', 'false') == 'true',
+        'pay_method': request.args.get('pay_method') or None,
+    }
+
+@app.route('/api/admin/orders')
+def api_admin_orders():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return jsonify({'error': 'غير مصرح'})
+    
+    limit = max(1, min(_arg_number('limit', int) or ORDERS_PAGE_SIZE, MAX_PAGE_SIZE))
+    orders, next_cursor = shop_system.orders.query(before=_arg_number('cursor', int), limit=limit, **_order_filters())
+    return jsonify({
+        'orders': [o.to_dict() for o in orders],
+        'html': ''.join(render_template('_order_row.html', order=o) for o in orders),
+        'next_cursor': next_cursor,
+        'total': len(shop_system.orders)
+    })
 
 @app.route('/admin/edit_product', methods=['POST'])
 def admin_edit_product():
@@ -283,51 +1397,216 @@ def admin_apply_offer():
     success = shop_system.admin_apply_offer(p_id, discount, gift, limit)
     return jsonify({'success': success})
 
+BULK_MAX_ITEMS = 10000
+
+@app.route('/admin/bulk_edit', methods=['POST'])
+def admin_bulk_edit():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return jsonify({'success': False, 'message': 'غير مصرح'})
+    
+    data = request.get_json(silent=True) or {}
+    edits = data.get('edits')
+    if not isinstance(edits, list) or not edits:
+        return jsonify({'success': False, 'message': 'لا توجد تعديلات'})
+    if len(edits) > BULK_MAX_ITEMS:
+        return jsonify({'success': False, 'message': f'الحد الأقصى {BULK_MAX_ITEMS} تعديل في الطلب'})
+    
+    results = shop_system.admin_bulk_edit(edits)
+    return jsonify({'success': True, 'updated': sum(r['success'] for r in results), 'results': results})
+
+@app.route('/admin/bulk_offer', methods=['POST'])
+def admin_bulk_offer():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return jsonify({'success': False, 'message': 'غير مصرح'})
+    
+    data = request.get_json(silent=True) or request.form.to_dict()
+    category = data.get('category') or None
+    product_ids = data.get('product_ids')
+    if product_ids is not None and not isinstance(product_ids, list):
+        # نص مثل "12" كان يُقرأ حرفاً حرفاً فيطبق العرض على المنتجين 1 و 2
+        return jsonify({'success': False, 'message': 'product_ids يجب أن تكون قائمة'}), 400
+    try:
+        discount = float(data.get('discount') or 0)
+        limit = int(data.get('limit') or 0)
+        if product_ids is not None:
+            product_ids = [int(p_id) for p_id in product_ids][:BULK_MAX_ITEMS]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'قيمة غير صالحة'})
+    if not 0 <= discount <= 100 or limit < 0:
+        return jsonify({'success': False, 'message': 'قيمة غير صالحة'})
+    if category is None and not product_ids:
+        return jsonify({'success': False, 'message': 'حدد تصنيفاً أو قائمة منتجات'})
+    gift = data.get('gift') or None
+    
+    results = shop_system.admin_bulk_offer(discount, gift, limit, category=category, product_ids=product_ids)
+    return jsonify({'success': True, 'updated': sum(r['success'] for r in results), 'results': results})
+
+@app.route('/admin/import_catalog', methods=['POST'])
+def admin_import_catalog():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return jsonify({'success': False, 'message': 'غير مصرح'})
+    
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'success': False, 'message': 'لم يتم اختيار ملف'})
+    import catalog_io   # يستعمله الاستيراد والتصدير الإداري فقط
+    fmt = request.form.get('format') or catalog_io.detect_format(upload.filename)
+    if fmt not in catalog_io.FORMATS:
+        return jsonify({'success': False, 'message': 'صيغة غير مدعومة'})
+    
+    # الملف يُقرأ كتدفق نصي سطراً بسطر ولا يُحمَّل كاملاً في الذاكرة
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    report = catalog_io.import_catalog(shop_system, stream, fmt)
+    if report['partial']:
+        report['message'] = (f"توقف الاستيراد عند السطر {report['stopped_at']}: "
+                             "حُفظت الأسطر السليمة قبله فقط، صحّح الملف وأعد استيراده")
+    return jsonify({'success': True, **report})
+
+@app.route('/admin/export_catalog')
+def admin_export_catalog():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return redirect(url_for('login'))
+    
+    import catalog_io
+    fmt = request.args.get('format', 'csv')
+    if fmt not in catalog_io.FORMATS:
+        return jsonify({'success': False, 'message': 'صيغة غير مدعومة'}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(catalog_io.export_catalog(shop_system.products, fmt)),
+                    mimetype=f'{mimetype}; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename=catalog.{fmt}'})
+
+@app.cli.command('import-catalog')
+@click.argument('path')
+@click.option('--format', 'fmt', default=None, help='csv أو jsonl (يُستنتج من الامتداد)')
+def import_catalog_command(path, fmt):
+    import catalog_io
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        report = catalog_io.import_catalog(shop_system, f, fmt or catalog_io.detect_format(path))
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+@app.cli.command('export-catalog')
+@click.argument('path')
+@click.option('--format', 'fmt', default=None, help='csv أو jsonl (يُستنتج من الامتداد)')
+def export_catalog_command(path, fmt):
+    import catalog_io
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in catalog_io.export_catalog(shop_system.products, fmt or catalog_io.detect_format(path)):
+            f.write(chunk)
+
 @app.route('/customer/dashboard')
+@cached_page
 def customer_dashboard():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    username = session['user']
-    user = shop_system.login(username, '')  # We'll find user by username
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
-    
-    cart_count = len(user.cart) if user else 0
-    return render_template('customer_dashboard.html', products=shop_system.products, cart_count=cart_count)
+    return render_template('customer_dashboard.html')
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+def _arg_number(name, kind=float):
+    try:
+        return kind(request.args[name])
+    except (KeyError, ValueError):
+        return None
+
+def _listing_filters():
+    return {
+        'category': request.args.get('category') or None,
+        'offers_only': request.args.get('offers_only', 'false') == 'true',
+        'in_stock_only': request.args.get('in_stock', 'false') == 'true',
+        'has_gift': request.args.get('has_gift', 'false') == 'true',
+        'min_price': _arg_number('min_price'),
+        'max_price': _arg_number('max_price'),
+        'price_band': _arg_number('price_band', int),
+    }
+
+def _listing_page(filters, query=None):
+    # مع نص بحث تكون النتائج مرتبة بالصلة والمؤشر إزاحة فيها، وبدونه ترتيب الإدراج
+    limit = _arg_number('limit', int) or PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = _arg_number('cursor', int)
+    if cursor is not None and cursor < 0:
+        cursor = None   # مؤشر غير صالح: الصفحة الأولى
+    if query:
+        return shop_system.products.search(query, offset=cursor or 0, limit=limit, **filters)
+    return shop_system.products.page(after=cursor, limit=limit, **filters)
+
+def _search_query():
+    return request.args.get('q', '').strip()[:200] or None
 
 @app.route('/customer/products')
+@cached_page
 def customer_products():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    username = session['user']
-    user = None
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
+    filters = _listing_filters()
+    query = _search_query()
+    products, next_cursor = _listing_page(filters, query)
+    next_url = next_api_url = None
+    if next_cursor is not None:
+        args = dict(request.args.items(), cursor=next_cursor)
+        next_url = url_for('customer_products', **args)
+        next_api_url = url_for('api_products', **args)
     
-    show_offers_only = request.args.get('offers_only', 'false') == 'true'
-    products = shop_system.products
-    if show_offers_only:
-        products = [p for p in products if p.offer_discount > 0 or p.offer_gift]
+    return render_template('customer_products.html', products=products,
+                           show_offers_only=filters['offers_only'], filters=filters, query=query,
+                           categories=shop_system.products.categories(), next_cursor=next_cursor,
+                           facets=shop_system.products.facet_counts(**filters),
+                           price_bands=[(b, band_label(b)) for b in range(len(PRICE_BANDS) + 1)],
+                           next_url=next_url, next_api_url=next_api_url, info_batch=MAX_PAGE_SIZE)
+
+@app.route('/api/products')
+def api_products():
+    if 'user' not in session:
+        return jsonify({'error': 'غير مصرح'})
     
-    return render_template('customer_products.html', products=products, user=user, show_offers_only=show_offers_only)
+    catalog = shop_system.products
+    def build():
+        filters = _listing_filters()
+        products, next_cursor = _listing_page(filters, _search_query())
+        return jsonify({
+            'products': [p.to_dict() for p in products],
+            'html': ''.join(fragment('product_card', p) for p in products),
+            'next_cursor': next_cursor,
+            'facets': catalog.facet_counts(**filters)
+        })
+    # الرد لا يعتمد على المستخدم، فالإصدار وحده يكفي (الاستعلام جزء من الرابط)
+    return conditional(make_etag(catalog.version), catalog.modified, build)
+
+@app.route('/api/search')
+def api_search():
+    if 'user' not in session:
+        return jsonify({'error': 'غير مصرح'})
+    
+    query = _search_query()
+    if not query:
+        return jsonify({'products': [], 'next_cursor': None})
+    products, next_cursor = _listing_page(_listing_filters(), query)
+    return jsonify({
+        'products': [p.to_dict() for p in products],
+        'next_cursor': next_cursor
+    })
+
+TYPEAHEAD_SIZE = 10
+
+@app.route('/api/typeahead')
+def api_typeahead():
+    if 'user' not in session:
+        return jsonify({'error': 'غير مصرح'})
+    
+    k = max(1, min(_arg_number('limit', int) or TYPEAHEAD_SIZE, TYPEAHEAD_SIZE))
+    suggestions = shop_system.products.typeahead.suggest(request.args.get('q', '')[:100], k)
+    return jsonify({'suggestions': [{'id': p_id, 'name': name} for p_id, name in suggestions]})
 
 @app.route('/customer/add_to_cart', methods=['POST'])
 def add_to_cart():
     if 'user' not in session:
         return jsonify({'success': False, 'message': 'يجب تسجيل الدخول'})
     
-    username = session['user']
-    user = None
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
+    user = g.user
     
     if not user:
         return jsonify({'success': False, 'message': 'المستخدم غير موجود'})
@@ -339,38 +1618,17 @@ def add_to_cart():
     if not product:
         return jsonify({'success': False, 'message': 'المنتج غير موجود'})
     
-    # Check current cart quantity
-    current_in_cart = 0
-    for item in user.cart:
-        if item['product'].id == product_id:
-            current_in_cart += item['qty']
-    
-    # Check limits
-    max_allowed = product.stock
-    if product.offer_limit > 0:
-        remaining_limit = product.offer_limit - current_in_cart
-        if remaining_limit <= 0:
-            return jsonify({'success': False, 'message': f'لقد استهلكت الحد الأقصى لهذا العرض ({product.offer_limit} قطع)'})
-        max_allowed = min(product.stock, remaining_limit)
-    
-    if qty <= 0 or qty > max_allowed:
-        return jsonify({'success': False, 'message': f'الكمية غير صحيحة. الحد المسموح: {max_allowed}'})
-    
-    # Add to cart
-    user.cart.append({'product': product, 'qty': qty})
-    return jsonify({'success': True, 'message': f'تم إضافة {qty} من {product.name} بنجاح', 'cart_count': len(user.cart)})
+    success, message = shop_system.add_to_cart(user, product, qty)
+    if not success:
+        return jsonify({'success': False, 'message': message})
+    return jsonify({'success': True, 'message': message, 'cart_count': len(user.cart)})
 
 @app.route('/customer/cart')
 def customer_cart():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    username = session['user']
-    user = None
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
+    user = g.user
     
     if not user:
         return redirect(url_for('login'))
@@ -383,31 +1641,24 @@ def remove_from_cart():
     if 'user' not in session:
         return jsonify({'success': False})
     
-    username = session['user']
-    user = None
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
+    user = g.user
     
     if not user:
         return jsonify({'success': False})
     
     product_id = int(request.json.get('product_id'))
-    user.cart = [item for item in user.cart if item['product'].id != product_id]
+    shop_system.remove_from_cart(user, product_id)
     return jsonify({'success': True, 'cart_count': len(user.cart)})
 
+# مدة انتظار مكان في طابور الطلبات قبل رفض الشراء عند الازدحام
+CHECKOUT_ADMIT_TIMEOUT = float(os.environ.get('SHOP_CHECKOUT_ADMIT_TIMEOUT', 2))
+
 @app.route('/customer/checkout', methods=['GET', 'POST'])
 def checkout():
     if 'user' not in session:
         return redirect(url_for('login'))
     
-    username = session['user']
-    user = None
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
+    user = g.user
     
     if not user or not user.cart:
         return redirect(url_for('customer_cart'))
@@ -416,9 +1667,10 @@ def checkout():
         address = request.form.get('address', 'استلام من الفرع')
         pay_method = request.form.get('pay_method')
         
-        success, result = shop_system.checkout(user, address, pay_method)
+        success, result = shop_system.checkout(user, address, pay_method, admit_timeout=CHECKOUT_ADMIT_TIMEOUT)
         if success:
-            flash(f'تم إتمام الطلب بنجاح! المبلغ: {result:.2f}$', 'success')
+            order_id, total = result
+            flash(f'تم استلام الطلب رقم {order_id} بنجاح! المبلغ: {total:.2f}$', 'success')
             return redirect(url_for('customer_dashboard'))
         else:
             flash(result, 'error')
@@ -426,39 +1678,100 @@ def checkout():
     total = shop_system.get_cart_total(user)
     return render_template('checkout.html', user=user, total=total)
 
+@app.route('/admin/order_queue')
+def admin_order_queue():
+    if 'user' not in session or session.get('role') != 'Admin':
+        return jsonify({'success': False, 'message': 'غير مصرح'})
+    return jsonify({'success': True, **shop_system.pipeline.stats()})
+
+@app.route('/api/orders/<int:order_id>/status')
+def api_order_status(order_id):
+    if 'user' not in session or not g.user:
+        return jsonify({'error': 'غير مصرح'})
+    status = shop_system.order_status(g.user, order_id)
+    if status is None:
+        return jsonify({'error': 'الطلب غير موجود'})
+    return jsonify(status)
+
 @app.route('/api/product/<int:product_id>')
 def get_product_info(product_id):
     if 'user' not in session:
         return jsonify({'error': 'غير مصرح'})
     
-    username = session['user']
-    user = None
-    for u in shop_system.users:
-        if u.username == username:
-            user = u
-            break
+    user = g.user
     
     product = shop_system.get_product_by_id(product_id)
     if not product:
         return jsonify({'error': 'المنتج غير موجود'})
     
-    current_in_cart = 0
-    for item in user.cart:
-        if item['product'].id == product_id:
-            current_in_cart += item['qty']
-    
-    max_allowed = product.stock
-    remaining_limit = None
-    if product.offer_limit > 0:
-        remaining_limit = product.offer_limit - current_in_cart
-        max_allowed = min(product.stock, remaining_limit)
+    # الحدود مشتقة من المنتج والكمية في السلة، فهما (مع الإصدار) يحددان الرد كله
+    etag = make_etag(product.version, session['user'], user.cart.qty_of(product.id))
+    modified = max(product.modified, user.cart.modified)
     
-    return jsonify({
+    return conditional(etag, modified, lambda: jsonify(_product_info(user, product)))
+
+def _product_info(user, product):
+    current_in_cart, max_allowed, remaining_limit = shop_system.cart_limits(user, product)
+    return {
         'product': product.to_dict(),
         'current_in_cart': current_in_cart,
         'max_allowed': max_allowed,
         'remaining_limit': remaining_limit
-    })
+    }
+
+@app.route('/api/products/info')
+def api_products_info():
+    # نفس رد /api/product/<id> لعدة منتجات (?ids=1,2,3) في طلب واحد:
+    # المستخدم وسلته يُحددان مرة واحدة للدفعة كلها
+    if 'user' not in session:
+        return jsonify({'error': 'غير مصرح'})
+    
+    user = g.user
+    if not user:
+        return jsonify({'error': 'المستخدم غير موجود'})
+    
+    try:
+        ids = list(dict.fromkeys(int(i) for i in request.args.get('ids', '').split(',') if i.strip()))
+    except ValueError:
+        return jsonify({'error': 'معرفات غير صالحة'})
+    if len(ids) > MAX_PAGE_SIZE:
+        return jsonify({'error': f'الحد الأقصى {MAX_PAGE_SIZE} منتج في الطلب'})
+    
+    catalog = shop_system.products
+    cart = user.cart
+    etag = make_etag(catalog.version, session['user'], [(p_id, cart.qty_of(p_id)) for p_id in ids])
+    
+    def build():
+        products = {}
+        missing = []
+        for p_id in ids:
+            product = catalog.get(p_id)
+            if product is None:
+                missing.append(p_id)
+            else:
+                products[str(p_id)] = _product_info(user, product)
+        return jsonify({'products': products, 'missing': missing})
+    return conditional(etag, max(catalog.modified, cart.modified), build)
+
+_t = _mark('routes', _t)
+
+def warm_up():
+    # ترجمة كل القوالب (وتخزينها في ذاكرة Jinja وعلى القرص) وعرض صفحات الدخول مسبقاً
+    started = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    with app.test_request_context('/home'):
+        render_template('home.html')
+        render_template('login.html')
+        render_template('register.html')
+    _mark('warmup', started)
+
+# SHOP_WARMUP=sync قبل استقبال الطلبات، أو background بالتوازي مع أول طلب
+_warmup_mode = os.environ.get('SHOP_WARMUP', 'off')
+if _warmup_mode == 'sync':
+    warm_up()
+elif _warmup_mode == 'background':
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
@@ -0,0 +1,139 @@
+import asyncio
+import io
+import os
+import time
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from werkzeug.exceptions import HTTPException
+
+import app as shop
+from events import RETRY_MS
+
+# ==============================================================================
+#                       وضع التشغيل غير المتزامن (ASGI)
+# ==============================================================================
+# كل المسارات يخدمها تطبيق Flask نفسه (نفس الدوال، الجلسة، الـ ETag) عبر a2wsgi
+# في مجموعة خيوط (SHOP_ASGI_THREADS)، فلا يُنفذ كود Flask المتزامن داخل حلقة
+# asyncio ولا يوقف بقية الاتصالات. الفرق الوحيد عن WSGI هو /api/stream: كل اتصال
+# coroutine ينتظر حدثاً في الحلقة بدل أن يحجز خيطاً أو عاملاً طوال بقاء الصفحة
+# مفتوحة. لطلبات JSON العادية هذا الوضع ليس أسرع من العمال المتزامنين (انظر README).
+#
+# التشغيل (uvicorn و a2wsgi اعتمادات اختيارية وليست في requirements.txt):
+#   SHOP_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn asgi:app --workers 4
+#   uvicorn asgi:app   (عملية واحدة؛ --workers يفقد TCP_NODELAY، انظر README)
+
+flask_app = shop.app
+EVENTS = shop.EVENTS
+
+ASGI_THREADS = int(os.environ.get('SHOP_ASGI_THREADS', 32))
+STREAM_MAX_SECONDS = shop.STREAM_MAX_SECONDS
+
+_wsgi = WSGIMiddleware(flask_app, workers=ASGI_THREADS)
+
+
+def _endpoint(scope):
+    # نفس جدول مسارات Flask، فلا تُكرر المسارات هنا
+    adapter = flask_app.url_map.bind('localhost', script_name=scope.get('root_path') or None)
+    try:
+        return adapter.match(scope['path'], method=scope['method'])[0]
+    except HTTPException:
+        return None
+
+
+# ----------------------------- التحديثات الحية -----------------------------
+# كل اتصال مجرد coroutine ينتظر حدثاً مشتركاً؛ خيط EventBroker يوقظ الحلقة
+# بعد كل حدث عبر call_soon_threadsafe، وكل اتصال يقرأ ما فاته بـ EVENTS.poll.
+
+class _Wakeup:
+    def __init__(self):
+        self.loop = None
+        self.event = None
+
+    def bind(self, loop):
+        if self.loop is None:
+            self.loop = loop
+            self.event = asyncio.Event()
+            EVENTS.listen(self.fire)
+
+    def fire(self):
+        self.loop.call_soon_threadsafe(self._swap)
+
+    def _swap(self):
+        # المنتظرون يحملون الحدث القديم؛ الحدث الجديد لمن يبدأ الانتظار بعد الآن
+        event, self.event = self.event, asyncio.Event()
+        event.set()
+
+
+_wakeup = _Wakeup()
+
+
+def _stream_params(scope):
+    # الجلسة والتحقق كما في api_stream؛ طلب GET بلا جسم
+    with flask_app.request_context(build_environ(scope, io.BytesIO())):
+        return shop.stream_params()
+
+
+async def stream(scope, receive, send, heartbeat=15.0):
+    # قراءة الجلسة (فك توقيع الكوكي) في خيط، والرفض يرده Flask نفسه عبر a2wsgi
+    allowed, last_id = await asyncio.get_running_loop().run_in_executor(None, _stream_params, scope)
+    if not allowed:
+        return await _wsgi(scope, receive, send)
+    _wakeup.bind(asyncio.get_running_loop())
+    started = time.monotonic()
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'), (b'vary', b'Cookie')]})
+    seq = EVENTS.subscribe(last_id)
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.body', 'body': f'retry: {RETRY_MS}\n\n'.encode(), 'more_body': True})
+        while not EVENTS.closed:
+            event = _wakeup.event
+            text, seq = EVENTS.poll(seq)
+            if not text:
+                woke = asyncio.ensure_future(event.wait())
+                done, _ = await asyncio.wait({woke, disconnected}, timeout=heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                woke.cancel()
+                if disconnected in done:
+                    return
+                if woke in done:
+                    continue
+                text = ': ping\n\n'
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+            if STREAM_MAX_SECONDS and time.monotonic() - started > STREAM_MAX_SECONDS:
+                break
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        EVENTS.unsubscribe()
+
+
+async def _wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+# ----------------------------- التوجيه -----------------------------
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # إيقاف الطابور وإغلاق التخزين يتم في atexit داخل app.py
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if _endpoint(scope) == 'api_stream':
+        return await stream(scope, receive, send)
+    await _wsgi(scope, receive, send)
@@ -0,0 +1,240 @@
+"""
+Shared pieces of the load benchmarks: starting the shop server and a
+minimal asyncio HTTP/1.1 client.
+
+Every simulated connection is one coroutine holding one socket, so thousands
+of concurrent connections cost a single event loop rather than a thread
+each. Connections are kept alive between requests; when the server closes
+them (gunicorn sync workers answer with "Connection: close") the next
+request reconnects and the connect time is part of its latency, as a
+browser would see it.
+
+Only what the shop's responses need is supported: Content-Length and
+chunked bodies, plain TCP, one request in flight per connection.
+"""
+import asyncio
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = '127.0.0.1'
+SERVER_MODES = ('sync', 'gevent', 'asgi')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def server_command(mode, port, workers, backlog=2048):
+    """gunicorn with sync or gevent workers on app:app, or uvicorn workers on asgi:app.
+
+    The sync mode passes --threads 1: gunicorn.conf.py defaults to 8 threads,
+    and gunicorn silently turns a sync worker with threads > 1 into gthread.
+
+    The ASGI mode also runs under gunicorn: `uvicorn --workers N` hands its
+    children a listening socket without TCP_NODELAY, which adds a 40 ms
+    delayed-ACK stall to every response.
+    """
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'{HOST}:{port}', '--workers', str(workers),
+               '--backlog', str(backlog)]
+    if mode == 'sync':
+        return [*command, '--worker-class', 'sync', '--threads', '1', 'app:app']
+    if mode == 'gevent':
+        return [*command, '--worker-class', 'gevent', 'app:app']
+    if mode == 'asgi':
+        return [*command, '--worker-class', 'uvicorn.workers.UvicornWorker', 'asgi:app']
+    raise ValueError(f'unknown server mode: {mode}')
+
+
+def start_server(mode, port, workers, backlog=2048, env=None):
+    env = dict(os.environ, SHOP_WARMUP='sync', **(env or {}))
+    return subprocess.Popen(server_command(mode, port, workers, backlog), cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(proc):
+    proc.kill()
+    proc.wait()
+
+
+class Connection:
+    def __init__(self, host, port, timeout=30.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        # Returns (status, lower-cased headers, body). A kept-alive connection the
+        # server closed while idle is retried once on a fresh socket.
+        reused = self._writer is not None
+        try:
+            return await asyncio.wait_for(self._request(method, path, headers, body), self.timeout)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            if not reused:
+                raise
+            return await asyncio.wait_for(self._request(method, path, headers, body), self.timeout)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _request(self, method, path, headers, body):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}']
+        for name, value in (headers or {}).items():
+            lines.append(f'{name}: {value}')
+        if body or method in ('POST', 'PUT'):
+            lines.append(f'Content-Length: {len(body)}')
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+
+        head = await self._reader.readuntil(b'\r\n\r\n')
+        status_line, *header_lines = head.decode('latin-1').split('\r\n')
+        version, status = status_line.split(' ', 2)[:2]
+        status = int(status)
+        response_headers = {}
+        for line in header_lines:
+            if line:
+                name, _, value = line.partition(':')
+                response_headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            data = b''
+        elif 'content-length' in response_headers:
+            data = await self._reader.readexactly(int(response_headers['content-length']))
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunks.append(await self._reader.readexactly(size + 2))
+                if not size:
+                    break
+            data = b''.join(c[:-2] for c in chunks)
+        else:
+            data = await self._reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close' or version == 'HTTP/1.0':
+            await self.close()
+        return status, response_headers, data
+
+    async def close(self):
+        writer, self._writer, self._reader = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+async def wait_until_up(host, port, path='/home', timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = Connection(host, port, timeout=5.0)
+        try:
+            status, _, _ = await conn.request('GET', path)
+            if status < 500:
+                return
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            await conn.close()
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'server on port {port} did not come up')
+        await asyncio.sleep(0.1)
+
+
+async def login(host, port, username, password):
+    # Returns the Cookie header value for the Flask session.
+    conn = Connection(host, port)
+    try:
+        body = f'username={username}&password={password}'.encode()
+        status, headers, _ = await conn.request(
+            'POST', '/login', {'Content-Type': 'application/x-www-form-urlencoded'}, body)
+    finally:
+        await conn.close()
+    cookie = headers.get('set-cookie', '').split(';')[0]
+    if status != 302 or not cookie:
+        raise RuntimeError(f'login as {username!r} failed (status {status})')
+    return cookie
+
+
+async def run_load(host, port, connections, duration, next_request, warmup=1.0, ramp=1.0, timeout=30.0):
+    """Drive `connections` keep-alive connections for warmup + duration seconds.
+
+    next_request(conn_index, n) returns (method, path, headers, body) for the
+    n-th request of a connection. Connections are opened over `ramp` seconds
+    so the listen backlog is not flooded with SYNs at once. Only requests
+    that start after the warm-up are recorded.
+    """
+    started = time.monotonic()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+    latencies = []
+    errors = {}
+
+    async def worker(index):
+        await asyncio.sleep(ramp * index / connections)
+        conn = Connection(host, port, timeout)
+        n = 0
+        try:
+            while True:
+                t0 = time.monotonic()
+                if t0 >= deadline:
+                    return
+                method, path, headers, body = next_request(index, n)
+                n += 1
+                try:
+                    status, _, _ = await conn.request(method, path, headers, body)
+                    error = f'http {status}' if status >= 500 else None
+                except asyncio.TimeoutError:
+                    error = 'timeout'
+                except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                    error = type(e).__name__
+                if error:
+                    if t0 >= measure_from:
+                        errors[error] = errors.get(error, 0) + 1
+                    await asyncio.sleep(0.05)
+                elif t0 >= measure_from:
+                    latencies.append(time.monotonic() - t0)
+        finally:
+            await conn.close()
+
+    await asyncio.gather(*(worker(i) for i in range(connections)))
+    elapsed = max(time.monotonic() - measure_from, 1e-9)
+    return summarize(latencies, errors, elapsed)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors.values()),
+        'error_kinds': errors,
+        'seconds': round(elapsed, 2),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Sync WSGI vs ASGI serving of the storefront's small JSON calls.
+
+Starts the shop once per serving mode with the same number of worker
+processes and drives it with thousands of concurrent keep-alive
+connections. Each connection behaves like a storefront tab: mostly
+GET /api/product/<id>, with add_to_cart / remove_from_cart in between, all
+under one logged-in session. Reports requests/sec and p50/p95/p99 latency
+per mode and connection count.
+
+Modes:
+    sync    gunicorn app:app with sync workers and --threads 1 (one request
+            per worker)
+    gevent  gunicorn app:app with gevent workers
+    asgi    gunicorn asgi:app with uvicorn.workers.UvicornWorker (Flask
+            routes run on a2wsgi's thread pool)
+
+Usage:
+    python benchmarks/asgi_vs_wsgi.py [--connections 500 2000] [--duration 10]
+                                      [--workers 2] [--modes sync asgi] [--json]
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from _http import (HOST, SERVER_MODES, Connection, free_port, login, run_load, start_server, stop_server,
+                   wait_until_up)
+
+
+def request_mix(cookie, product_ids, seed=0):
+    # Per connection: five product lookups, then add one unit of the last
+    # product and remove it again, so carts stay small for the whole run.
+    rng = random.Random(seed)
+    json_headers = {'Cookie': cookie, 'Content-Type': 'application/json'}
+    get_headers = {'Cookie': cookie}
+    last = {}
+
+    def next_request(index, n):
+        step = n % 7
+        if step < 5:
+            p_id = last[index] = rng.choice(product_ids)
+            return 'GET', f'/api/product/{p_id}', get_headers, b''
+        body = json.dumps({'product_id': last.get(index, product_ids[0]), 'qty': 1}).encode()
+        path = '/customer/add_to_cart' if step == 5 else '/customer/remove_from_cart'
+        return 'POST', path, json_headers, body
+
+    return next_request
+
+
+async def measure(port, connections, duration, warmup):
+    cookie = await login(HOST, port, 'admin', '123')
+    conn = Connection(HOST, port)
+    try:
+        _, _, body = await conn.request('GET', '/api/products?limit=100', {'Cookie': cookie})
+    finally:
+        await conn.close()
+    product_ids = [p['id'] for p in json.loads(body)['products']]
+    return await run_load(HOST, port, connections, duration, request_mix(cookie, product_ids),
+                          warmup=warmup, ramp=min(2.0, warmup))
+
+
+def run_mode(mode, args):
+    port = free_port()
+    proc = start_server(mode, port, args.workers, args.backlog)
+    try:
+        asyncio.run(wait_until_up(HOST, port))
+        results = []
+        for connections in args.connections:
+            result = asyncio.run(measure(port, connections, args.duration, args.warmup))
+            results.append({'mode': mode, 'connections': connections, **result})
+        return results
+    finally:
+        stop_server(proc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sync WSGI and ASGI serving of the JSON routes.')
+    parser.add_argument('--connections', type=int, nargs='+', default=[500, 2000])
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before each run')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes for every mode')
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--modes', nargs='+', choices=SERVER_MODES, default=['sync', 'asgi'])
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    rows = []
+    for mode in args.modes:
+        rows.extend(run_mode(mode, args))
+
+    if args.json:
+        print(json.dumps({'workers': args.workers, 'duration': args.duration, 'results': rows}, indent=2))
+        return
+
+    print(f"{'mode':>7} {'conns':>6} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'errors':>7}")
+    for r in rows:
+        cells = ' '.join(f"{r[k]:>7.1f}ms" if r[k] is not None else f"{'-':>9}" for k in ('p50_ms', 'p95_ms', 'p99_ms'))
+        print(f"{r['mode']:>7} {r['connections']:>6} {r['rps']:>9.1f} {cells} {r['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
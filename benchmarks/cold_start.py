@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Cold-start (wake-to-first-byte) measurement for the shop server.
+
+Starts the server the same way the Procfile does (gunicorn, one worker),
+sends GET /home as soon as the port accepts connections, and records the
+time from process spawn to the first response byte. The server-side phase
+breakdown from /healthz/startup is printed next to it so a regression can
+be traced to imports, app setup, state loading, routes or warm-up.
+
+Exits with status 1 when the median wake-to-first-byte exceeds the budget.
+
+Usage:
+    python benchmarks/cold_start.py [--runs 5] [--budget-ms 1000] [--cold] [--json]
+    SHOP_WARMUP=sync python benchmarks/cold_start.py
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(port, path, timeout=5.0):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def measure_once(env, timeout=30.0):
+    port = free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--workers', '1']
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError('server did not answer in time')
+            try:
+                status, _ = get(port, '/home')
+                first_byte_ms = (time.perf_counter() - started) * 1000
+                break
+            except OSError:
+                time.sleep(0.002)
+        _, body = get(port, '/healthz/startup')
+        return {'status': status, 'wake_to_first_byte_ms': round(first_byte_ms, 2), 'server': json.loads(body)}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure wake-to-first-byte for the shop server.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('SHOP_STARTUP_BUDGET_MS', 1000)))
+    parser.add_argument('--cold', action='store_true', help='clear the Jinja bytecode cache before every run')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    env = dict(os.environ, SHOP_STARTUP_BUDGET_MS=str(args.budget_ms))
+    cache_dir = env.get('SHOP_JINJA_CACHE', os.path.join(ROOT, 'instance', 'jinja-cache'))
+
+    runs = []
+    for _ in range(args.runs):
+        if args.cold:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        runs.append(measure_once(env))
+
+    timings = [r['wake_to_first_byte_ms'] for r in runs]
+    result = {
+        'runs': runs,
+        'median_ms': round(statistics.median(timings), 2),
+        'max_ms': round(max(timings), 2),
+        'budget_ms': args.budget_ms,
+    }
+    result['over_budget'] = result['median_ms'] > args.budget_ms
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        phases = sorted({p for r in runs for p in r['server']['phases']})
+        print(f"{'run':>4} {'first byte':>11} " + ' '.join(f'{p:>12}' for p in phases))
+        for i, r in enumerate(runs, 1):
+            cells = ' '.join(f"{r['server']['phases'].get(p, 0):>12.1f}" for p in phases)
+            print(f"{i:>4} {r['wake_to_first_byte_ms']:>9.1f}ms {cells}")
+        verdict = 'OVER BUDGET' if result['over_budget'] else 'ok'
+        print(f"median {result['median_ms']:.1f}ms, max {result['max_ms']:.1f}ms, budget {args.budget_ms:.0f}ms: {verdict}")
+
+    sys.exit(1 if result['over_budget'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the storefront and checkout flows.
+
+Starts the shop locally, prepares the catalog through the admin API (deep
+stock so checkouts never run out, an offer on every third product so
+`offers_only` has results) and then runs every scenario at every
+concurrency level for a fixed time. A fresh server is started for each run
+so results do not depend on what earlier runs left behind. Each virtual
+user registers its own account and keeps its session cookie, like a
+browser tab:
+
+    login     log in again and open the dashboard
+    browse    products page, products page with offers_only, and the JSON
+              listing the page script fetches
+    cart      a burst of /api/product/<id> lookups, one batched
+              /api/products/info, then add_to_cart
+    checkout  add one to three items, open checkout, submit it and follow
+              the redirect to the dashboard
+    mixed     each user runs one of the above (browse 50%, cart 30%,
+              checkout 15%, login 5%)
+
+Every run reports throughput (requests/s, and scenario iterations/s, so the
+checkout run reads as checkouts/s), error rate, and p50/p95/p99 latency per
+step and overall. --json prints the results and --output writes them to a
+file. Before each run a few malformed listing requests that used to answer
+500 (EDGE_CASES) are sent once, and any 5xx among them stops the script.
+
+Regression mode: --save-baseline stores the results, and --check compares a
+new run against them. The script exits 1 when any step's p50/p95/p99
+exceeds its baseline by more than --tolerance (and by at least
+--min-delta-ms), or when its error rate grew by more than
+--max-error-increase.
+
+Usage:
+    python benchmarks/loadtest.py [--scenarios checkout mixed] [--concurrency 10 50 200]
+                                  [--duration 10] [--mode sync|gevent|asgi] [--workers 1]
+                                  [--storage memory|sqlite|journal] [--json] [--output FILE]
+    python benchmarks/loadtest.py --save-baseline [FILE]
+    python benchmarks/loadtest.py --check [FILE] [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.parse
+
+from _http import (HOST, SERVER_MODES, Connection, free_port, login, start_server, stop_server, summarize,
+                   wait_until_up)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'loadtest.json')
+SCENARIOS = ('login', 'browse', 'cart', 'checkout', 'mixed')
+# Interleaved so that even a handful of users covers every scenario
+MIXED = ['browse', 'cart', 'browse', 'checkout', 'browse', 'cart', 'browse', 'login', 'browse', 'cart',
+         'browse', 'checkout', 'browse', 'cart', 'browse', 'cart', 'browse', 'checkout', 'browse', 'cart']
+PERCENTILES = ('p50_ms', 'p95_ms', 'p99_ms')
+MIN_SAMPLES = 20
+PAY_METHODS = ('Online Payment', 'Cash on Delivery', 'Visa on Delivery')
+FORM = 'application/x-www-form-urlencoded'
+
+
+class Recorder:
+    def __init__(self, measure_from):
+        self.measure_from = measure_from
+        self.steps = {}        # step -> (latencies, {error: count})
+        self.iterations = 0
+
+    def record(self, step, started, elapsed, error, always=False):
+        if not always and started < self.measure_from:
+            return
+        latencies, errors = self.steps.setdefault(step, ([], {}))
+        if error:
+            errors[error] = errors.get(error, 0) + 1
+        else:
+            latencies.append(elapsed)
+
+    def iteration(self, started):
+        if started >= self.measure_from:
+            self.iterations += 1
+
+
+class VirtualUser:
+    def __init__(self, index, port, recorder, product_ids, timeout):
+        self.index = index
+        self.username = f'load{index}'
+        self.conn = Connection(HOST, port, timeout)
+        self.recorder = recorder
+        self.product_ids = product_ids
+        self.rng = random.Random(index)
+        self.cookie = None
+
+    async def call(self, step, method, path, body=b'', content_type=None, check=None, always=False):
+        # Returns the parsed response (status, headers, body) or None when the
+        # step failed; failures are counted under the step instead of raised.
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if content_type:
+            headers['Content-Type'] = content_type
+        started = time.monotonic()
+        try:
+            status, response_headers, data = await self.conn.request(method, path, headers, body)
+        except asyncio.TimeoutError:
+            self.recorder.record(step, started, 0, 'timeout', always)
+            return None
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self.recorder.record(step, started, 0, type(e).__name__, always)
+            return None
+        elapsed = time.monotonic() - started
+        cookie = response_headers.get('set-cookie')
+        if cookie:
+            self.cookie = cookie.split(';')[0]
+        error = f'http {status}' if status >= 500 else (check(status, response_headers, data) if check else None)
+        self.recorder.record(step, started, elapsed, error, always)
+        return None if error else (status, response_headers, data)
+
+    # ----------------------------- steps -----------------------------
+
+    async def register(self):
+        body = urllib.parse.urlencode({'username': self.username, 'password': 'load'}).encode()
+        return await self.call('register', 'POST', '/register', body, FORM, check=redirect_to('/customer/dashboard'),
+                               always=True)
+
+    async def add_to_cart(self, p_id, qty=1):
+        body = json.dumps({'product_id': p_id, 'qty': qty}).encode()
+        return await self.call('add_to_cart', 'POST', '/customer/add_to_cart', body, 'application/json',
+                               check=json_ok('success'))
+
+    # ----------------------------- scenarios -----------------------------
+
+    async def login(self):
+        body = urllib.parse.urlencode({'username': self.username, 'password': 'load'}).encode()
+        if await self.call('login', 'POST', '/login', body, FORM, check=redirect_to('/customer/dashboard')):
+            await self.call('dashboard', 'GET', '/customer/dashboard', check=status_in(200))
+
+    async def browse(self):
+        await self.call('products_page', 'GET', '/customer/products', check=status_in(200))
+        await self.call('products_page_offers', 'GET', '/customer/products?offers_only=true', check=status_in(200))
+        await self.call('api_products', 'GET', '/api/products?offers_only=true&limit=24', check=json_ok())
+
+    async def cart(self):
+        ids = self.rng.sample(self.product_ids, min(5, len(self.product_ids)))
+        for p_id in ids:
+            await self.call('api_product', 'GET', f'/api/product/{p_id}', check=json_ok())
+        await self.call('products_info', 'GET', '/api/products/info?ids=' + ','.join(map(str, ids)), check=json_ok())
+        await self.add_to_cart(ids[0])
+
+    async def checkout(self):
+        for p_id in self.rng.sample(self.product_ids, self.rng.randint(1, 3)):
+            await self.add_to_cart(p_id, self.rng.randint(1, 2))
+        if not await self.call('checkout_page', 'GET', '/customer/checkout', check=status_in(200)):
+            return
+        body = urllib.parse.urlencode({'address': 'load test', 'pay_method': self.rng.choice(PAY_METHODS)}).encode()
+        if await self.call('checkout', 'POST', '/customer/checkout', body, FORM,
+                           check=redirect_to('/customer/dashboard')):
+            await self.call('dashboard', 'GET', '/customer/dashboard', check=status_in(200))
+
+    async def run(self, scenario, deadline):
+        if not await self.register():
+            return
+        if scenario == 'mixed':
+            scenario = MIXED[self.index % len(MIXED)]
+        iteration = getattr(self, scenario)
+        while True:
+            started = time.monotonic()
+            if started >= deadline:
+                return
+            await iteration()
+            self.recorder.iteration(started)
+
+    async def close(self):
+        await self.conn.close()
+
+
+def status_in(*expected):
+    def check(status, headers, data):
+        return None if status in expected else f'http {status}'
+    return check
+
+
+def redirect_to(path):
+    # The shop answers a rejected form (wrong password, failed checkout) by
+    # rendering the form again with a flash message instead of redirecting.
+    def check(status, headers, data):
+        if status == 302 and headers.get('location', '').endswith(path):
+            return None
+        return 'rejected' if status in (200, 302) else f'http {status}'
+    return check
+
+
+def json_ok(flag=None):
+    # JSON routes answer 200 with {"error": ...} or {"success": false, ...}.
+    def check(status, headers, data):
+        if status != 200:
+            return f'http {status}'
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return 'bad json'
+        if 'error' in payload or (flag and not payload.get(flag)):
+            return 'rejected'
+        return None
+    return check
+
+
+async def prepare_catalog(port, stock):
+    # Enough stock for the whole run, and an offer on every third product.
+    cookie = await login(HOST, port, 'admin', '123')
+    conn = Connection(HOST, port)
+    headers = {'Cookie': cookie, 'Content-Type': 'application/json'}
+    try:
+        _, _, body = await conn.request('GET', '/api/products?limit=100', {'Cookie': cookie})
+        product_ids = [p['id'] for p in json.loads(body)['products']]
+        edits = [{'product_id': p_id, 'stock': stock} for p_id in product_ids]
+        await conn.request('POST', '/admin/bulk_edit', headers, json.dumps({'edits': edits}).encode())
+        offer = {'product_ids': product_ids[::3], 'discount': 10}
+        await conn.request('POST', '/admin/bulk_offer', headers, json.dumps(offer).encode())
+    finally:
+        await conn.close()
+    return product_ids
+
+
+# Requests that once answered 500; checked before every run so a regression
+# stops the load test instead of showing up as a small error rate.
+EDGE_CASES = ('/customer/products?cursor=-5', '/api/products?cursor=-5', '/api/products?cursor=-5&q=pro',
+              '/customer/products?cursor=abc&limit=-1')
+
+
+async def check_edge_cases(port):
+    cookie = await login(HOST, port, 'admin', '123')
+    conn = Connection(HOST, port)
+    try:
+        for path in EDGE_CASES:
+            status, _, _ = await conn.request('GET', path, {'Cookie': cookie})
+            if status >= 500:
+                raise RuntimeError(f'GET {path} answered {status}')
+    finally:
+        await conn.close()
+
+
+async def run_scenario(port, scenario, users, duration, warmup, timeout, stock):
+    await check_edge_cases(port)
+    product_ids = await prepare_catalog(port, stock)
+    started = time.monotonic()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+    recorder = Recorder(measure_from)
+    ramp = min(2.0, warmup)
+
+    async def user(index):
+        await asyncio.sleep(ramp * index / users)
+        vu = VirtualUser(index, port, recorder, product_ids, timeout)
+        try:
+            await vu.run(scenario, deadline)
+        finally:
+            await vu.close()
+
+    await asyncio.gather(*(user(i) for i in range(users)))
+    elapsed = max(time.monotonic() - measure_from, 1e-9)
+
+    steps = {}
+    all_latencies = []
+    all_errors = {}
+    for step, (latencies, errors) in sorted(recorder.steps.items()):
+        # Registration happens once per user during the ramp-up, so it does
+        # not count towards the run's throughput.
+        seconds = elapsed if step != 'register' else max(ramp, 1e-9)
+        steps[step] = with_error_rate(summarize(latencies, errors, seconds))
+        if step != 'register':
+            all_latencies.extend(latencies)
+            for error, count in errors.items():
+                all_errors[error] = all_errors.get(error, 0) + count
+    overall = with_error_rate(summarize(all_latencies, all_errors, elapsed))
+    return {
+        'scenario': scenario,
+        'concurrency': users,
+        'seconds': overall['seconds'],
+        'rps': overall['rps'],
+        'iterations': recorder.iterations,
+        'iterations_per_s': round(recorder.iterations / elapsed, 2),
+        'overall': overall,
+        'steps': steps,
+    }
+
+
+def with_error_rate(stats):
+    total = stats['requests'] + stats['errors']
+    stats['error_rate'] = round(stats['errors'] / total, 4) if total else 0.0
+    return stats
+
+
+def run_all(args):
+    results = []
+    for scenario in args.scenarios:
+        for users in args.concurrency:
+            with tempfile.TemporaryDirectory(prefix='shop-loadtest-') as tmp:
+                env = {'SHOP_STORAGE': args.storage,
+                       'SHOP_DB_PATH': os.path.join(tmp, 'shop.db'),
+                       'SHOP_JOURNAL_DIR': os.path.join(tmp, 'journal')}
+                port = free_port()
+                proc = start_server(args.mode, port, args.workers, env=env)
+                try:
+                    asyncio.run(wait_until_up(HOST, port))
+                    results.append(asyncio.run(run_scenario(port, scenario, users, args.duration, args.warmup,
+                                                            args.timeout, args.stock)))
+                finally:
+                    stop_server(proc)
+            if not args.json:
+                print_run(results[-1])
+    return results
+
+
+def print_run(result):
+    o = result['overall']
+    print(f"\n{result['scenario']} @ {result['concurrency']} users: {result['rps']:.1f} req/s, "
+          f"{result['iterations_per_s']:.2f} {result['scenario']}/s, errors {o['error_rate']:.2%}")
+    print(f"  {'step':<22} {'reqs':>7} {'err%':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for step, s in [*result['steps'].items(), ('(all)', o)]:
+        cells = ' '.join(f'{s[k]:>7.1f}ms' if s[k] is not None else f"{'-':>9}" for k in PERCENTILES)
+        print(f"  {step:<22} {s['requests']:>7} {s['error_rate']:>7.2%} {cells}")
+
+
+def compare(results, baseline, tolerance, min_delta_ms, max_error_increase):
+    # Returns human-readable regressions. Runs and steps missing from the
+    # baseline are skipped, and so is registration (one request per user,
+    # during ramp-up); percentiles are only compared with enough samples.
+    expected = {(r['scenario'], r['concurrency']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = expected.get((result['scenario'], result['concurrency']))
+        if base is None:
+            continue
+        name = f"{result['scenario']}@{result['concurrency']}"
+        for step, stats in [*result['steps'].items(), ('(all)', result['overall'])]:
+            base_stats = base['overall'] if step == '(all)' else base['steps'].get(step)
+            if base_stats is None or step == 'register':
+                continue
+            for key in PERCENTILES if min(stats['requests'], base_stats['requests']) >= MIN_SAMPLES else ():
+                now, before = stats[key], base_stats[key]
+                if now is None or before is None:
+                    continue
+                if now > before * (1 + tolerance) and now - before >= min_delta_ms:
+                    regressions.append(f'{name} {step} {key[:-3]} {now:.1f}ms > baseline {before:.1f}ms '
+                                       f'(+{(now / before - 1) if before else float("inf"):.0%})')
+            if stats['error_rate'] > base_stats['error_rate'] + max_error_increase:
+                regressions.append(f"{name} {step} error rate {stats['error_rate']:.2%} > baseline "
+                                   f"{base_stats['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the storefront and checkout flows.')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200], help='virtual users per run')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before each run')
+    parser.add_argument('--timeout', type=float, default=30.0, help='per-request timeout in seconds')
+    parser.add_argument('--mode', choices=SERVER_MODES, default='sync', help='how the server is run')
+    parser.add_argument('--workers', type=int, default=1, help='server worker processes')
+    parser.add_argument('--storage', choices=['memory', 'sqlite', 'journal'], default='memory')
+    parser.add_argument('--stock', type=int, default=1_000_000, help='stock set on every product before a run')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, metavar='FILE')
+    parser.add_argument('--check', nargs='?', const=DEFAULT_BASELINE, metavar='FILE',
+                        help='compare with a saved baseline and exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative latency increase')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='ignore latency increases smaller than this')
+    parser.add_argument('--max-error-increase', type=float, default=0.01, help='allowed error-rate increase')
+    args = parser.parse_args()
+    if args.workers > 1 and args.storage == 'memory':
+        parser.error('memory storage keeps state per process; use --storage sqlite with several workers')
+    baseline = None
+    if args.check:
+        try:
+            with open(args.check) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            parser.error(f'no baseline at {args.check}; create one with --save-baseline')
+
+    config = {k: getattr(args, k) for k in ('mode', 'workers', 'storage', 'duration', 'warmup', 'stock')}
+    report = {'config': config, 'results': run_all(args)}
+
+    if baseline is not None:
+        if baseline.get('config') != config:
+            print(f"warning: baseline was recorded with {baseline.get('config')}", file=sys.stderr)
+        report['baseline'] = args.check
+        report['regressions'] = compare(report['results'], baseline, args.tolerance, args.min_delta_ms,
+                                        args.max_error_increase)
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif baseline is not None:
+        print()
+        for line in report['regressions']:
+            print(f'REGRESSION {line}')
+        print(f"{len(report['regressions'])} regression(s) against {args.check}")
+    sys.exit(1 if report.get('regressions') else 0)
+
+
+if __name__ == '__main__':
+    main()
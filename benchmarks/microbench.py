@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Scaling microbenchmarks for the ShopSystem core, without HTTP.
+
+Grows one in-memory ShopSystem through a ladder of synthetic scales, from
+the 30 seeded products up to 1M products, 1M users and 10M orders. At every
+scale it times these operations call by call and reports mean/p50/p99:
+
+    get_product_by_id, register, login, get_cart_total, checkout,
+    admin_edit_product, admin_apply_offer
+
+It also records memory per product, user and order. The figure is
+tracemalloc's count over a sample of the entities added at that scale, so
+it includes their share of the indexes. Process RSS is recorded too.
+
+The slope column is the log-log growth of the mean latency against the
+catalog size: about 0 means constant time and about 1 means the operation
+scans something proportional to the data. --plot draws latency and memory
+against scale; it needs matplotlib, which is optional.
+
+Before building, a small calibration sample estimates the memory and build
+time of every scale. Scales that would not fit in the memory available to
+this process are skipped and reported as such; --force tries them anyway.
+
+Usage:
+    python benchmarks/microbench.py [--scales seed 1k 10k 100k 1m] [--calls 2000]
+                                    [--plot scaling.png] [--json] [--output FILE]
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Order, Product, ShopSystem  # noqa: E402
+
+# scale -> (products, users, orders) on top of the seeded data
+SCALES = {
+    'seed': (0, 0, 0),
+    '1k': (1_000, 1_000, 10_000),
+    '10k': (10_000, 10_000, 100_000),
+    '100k': (100_000, 100_000, 1_000_000),
+    '1m': (1_000_000, 1_000_000, 10_000_000),
+}
+OPERATIONS = ('get_product_by_id', 'register', 'login', 'get_cart_total', 'checkout',
+              'admin_edit_product', 'admin_apply_offer')
+CATEGORIES = ('Electronics', 'Clothing', 'Home', 'Sports', 'Books', 'Stationery', 'Travel')
+WORDS = ('Laptop', 'Phone', 'Headphones', 'Mouse', 'Keyboard', 'Monitor', 'Shirt', 'Jeans', 'Jacket',
+         'Shoes', 'Lamp', 'Blender', 'Towel', 'Racket', 'Notebook', 'Pen', 'Backpack', 'Bottle')
+PAY_METHODS = ('Online Payment', 'Cash on Delivery', 'Visa on Delivery')
+FIRST_ID = 1_000_000
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def available_bytes():
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+class Population:
+    """Adds synthetic products, users and orders to a ShopSystem."""
+
+    def __init__(self, shop, rng):
+        self.shop = shop
+        self.rng = rng
+        self.products = 0
+        self.users = 0
+        self.orders = 0
+        self.day0 = datetime.date.today() - datetime.timedelta(days=365)
+
+    def add_product(self):
+        i = self.products
+        name = f'{WORDS[i % len(WORDS)]} {WORDS[i // len(WORDS) % len(WORDS)]} {i % 10007}'
+        self.shop.products.add(Product(FIRST_ID + i, name, 5 + i % 995, 1_000_000, CATEGORIES[i % len(CATEGORIES)]))
+        self.products += 1
+
+    def add_user(self):
+        self.shop.users.add(self.shop._new_user(f'user{self.users}', 'pw', 'Customer'))
+        self.users += 1
+
+    def add_order(self):
+        rng = self.rng
+        lines = [[FIRST_ID + rng.randrange(self.products) if self.products else 101, rng.randint(1, 3)]
+                 for _ in range(rng.randint(1, 3))]
+        customer = f'user{rng.randrange(self.users)}' if self.users else 'admin'
+        order = Order(self.shop._next_order_id(), customer, 'synthetic', 10.0 * len(lines), 'addr',
+                      PAY_METHODS[self.orders % 3], 'Paid' if self.orders % 3 == 0 else 'Pending', lines)
+        order.date = (self.day0 + datetime.timedelta(days=self.orders % 365)).strftime('%Y-%m-%d 12:00')
+        self.shop._add_order(order)
+        self.orders += 1
+
+    def grow(self, kind, target, sample):
+        # The first `sample` additions run under tracemalloc to measure bytes
+        # per entity; the rest are added untraced at full speed.
+        add = getattr(self, f'add_{kind}')
+        current = lambda: getattr(self, f'{kind}s')  # noqa: E731
+        per_entity = None
+        started = time.perf_counter()
+        count = min(sample, target - current())
+        if count > 0:
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            for _ in range(count):
+                add()
+            per_entity = (tracemalloc.get_traced_memory()[0] - before) / count
+            tracemalloc.stop()
+        while current() < target:
+            add()
+        return per_entity, time.perf_counter() - started
+
+
+def calibrate(sample):
+    # Memory and build time per entity on a throwaway shop, for the estimates.
+    shop = ShopSystem(order_workers=0)
+    population = Population(shop, random.Random(1))
+    costs = {}
+    for kind in ('product', 'user', 'order'):
+        per_entity, _ = population.grow(kind, sample, sample)
+        started = time.perf_counter()
+        population.grow(kind, 2 * sample, 0)
+        costs[kind] = (per_entity, (time.perf_counter() - started) / sample)
+    return costs
+
+
+def estimate(costs, counts):
+    memory = sum(costs[k][0] * n for k, n in zip(('product', 'user', 'order'), counts))
+    seconds = sum(costs[k][1] * n for k, n in zip(('product', 'user', 'order'), counts))
+    return memory, seconds
+
+
+# ----------------------------- operations -----------------------------
+
+def timed(calls, setup, op):
+    # Per-call timing in microseconds; setup runs untimed before every call.
+    samples = []
+    for i in range(calls):
+        args = setup(i)
+        t0 = time.perf_counter_ns()
+        op(*args)
+        samples.append((time.perf_counter_ns() - t0) / 1000)
+    samples.sort()
+    return {
+        'calls': calls,
+        'mean_us': round(sum(samples) / calls, 3),
+        'p50_us': round(samples[calls // 2], 3),
+        'p99_us': round(samples[min(calls - 1, math.ceil(calls * 0.99) - 1)], 3),
+    }
+
+
+def measure(shop, population, scale, calls, rng):
+    product_ids = [p.id for p in shop.products]
+    usernames = [f'user{i}' for i in range(population.users)] or ['admin']
+    buyer = shop.register(f'bench-buyer-{scale}', 'pw')
+    shoppers = [shop.register(f'bench-cart-{scale}-{i}', 'pw') for i in range(100)]
+    for user in shoppers:
+        for p_id in rng.sample(product_ids, 3):
+            shop.add_to_cart(user, shop.get_product_by_id(p_id), 1)
+
+    def fill_cart(i):
+        buyer.cart.clear()
+        for p_id in rng.sample(product_ids, rng.randint(1, 3)):
+            shop.add_to_cart(buyer, shop.get_product_by_id(p_id), 1)
+        return buyer, 'addr', PAY_METHODS[i % 3]
+
+    results = {
+        'get_product_by_id': timed(calls, lambda i: (rng.choice(product_ids),), shop.get_product_by_id),
+        'register': timed(calls, lambda i: (f'bench-{scale}-{i}', 'pw'), shop.register),
+        'login': timed(calls, lambda i: (rng.choice(usernames), 'pw'), shop.login),
+        'get_cart_total': timed(calls, lambda i: (shoppers[i % len(shoppers)],), shop.get_cart_total),
+        'checkout': timed(calls, fill_cart, shop.checkout),
+        'admin_edit_product': timed(calls, lambda i: (rng.choice(product_ids), None, str(5 + i % 995), str(1_000_000)),
+                                    shop.admin_edit_product),
+        'admin_apply_offer': timed(calls, lambda i: (rng.choice(product_ids), i % 50, None, 0),
+                                   shop.admin_apply_offer),
+    }
+    return results
+
+
+def slope(points):
+    # Least-squares slope of log(mean) against log(size).
+    points = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    var = sum((x - mx) ** 2 for x, _ in points)
+    return round(sum((x - mx) * (y - my) for x, y in points) / var, 2) if var else None
+
+
+def plot(report, path):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed; skipping the plot', file=sys.stderr)
+        return False
+    runs = [r for r in report['scales'] if 'operations' in r]
+    sizes = [r['products'] for r in runs]
+    fig, (left, right) = plt.subplots(1, 2, figsize=(13, 5))
+    for op in OPERATIONS:
+        left.plot(sizes, [r['operations'][op]['mean_us'] for r in runs], marker='o', label=op)
+    left.set(xscale='log', yscale='log', xlabel='products (users and orders scale with it)',
+             ylabel='mean latency (µs)', title='ShopSystem operations')
+    left.legend(fontsize='small')
+    for kind in ('product', 'user', 'order'):
+        measured = [(r['products'], r['bytes_per_entity'][kind]) for r in runs if r['bytes_per_entity'][kind]]
+        right.plot([x for x, _ in measured], [y for _, y in measured], marker='o', label=kind)
+    right.set(xscale='log', xlabel='products', ylabel='bytes per entity', title='Memory per entity')
+    right.legend(fontsize='small')
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scaling microbenchmarks for ShopSystem core operations.')
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=list(SCALES))
+    parser.add_argument('--calls', type=int, default=2000, help='timed calls per operation and scale')
+    parser.add_argument('--memory-sample', type=int, default=10_000,
+                        help='entities per kind and scale added under tracemalloc')
+    parser.add_argument('--force', action='store_true', help='build scales even if they look too big for memory')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--plot', metavar='FILE', help='save a latency/memory chart (needs matplotlib)')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    def log(message):
+        if not args.json:
+            print(message, flush=True)
+
+    costs = calibrate(min(2000, args.memory_sample))
+    rng = random.Random(args.seed)
+    shop = ShopSystem(order_workers=0)
+    for product in shop.products:
+        # the seeded stock would run out during the checkout timings
+        product.stock = 1_000_000
+        shop.products.reindex(product)
+    population = Population(shop, rng)
+    base_rss = rss_bytes()
+    report = {'calls': args.calls, 'scales': []}
+
+    for scale in sorted(args.scales, key=lambda s: SCALES[s]):
+        counts = SCALES[scale]
+        deltas = [max(0, n - have) for n, have in zip(counts, (population.products, population.users,
+                                                                population.orders))]
+        need, build_s = estimate(costs, deltas)
+        free = available_bytes()
+        entry = {'scale': scale, 'products': len(shop.products) + deltas[0], 'users': len(shop.users) + deltas[1],
+                 'orders': len(shop.orders) + deltas[2], 'estimated_mb': round(need / 1e6),
+                 'estimated_build_s': round(build_s, 1)}
+        if free is not None and need > 0.8 * free and not args.force:
+            entry['skipped'] = f'needs ~{need / 1e6:.0f} MB more, {free / 1e6:.0f} MB available'
+            report['scales'].append(entry)
+            log(f"{scale}: skipped ({entry['skipped']})")
+            continue
+
+        log(f"{scale}: building {counts[0]:,} products, {counts[1]:,} users, {counts[2]:,} orders "
+            f"(~{build_s:.0f}s, ~{need / 1e6:.0f} MB)")
+        per_entity = {}
+        build_seconds = {}
+        for kind, target in zip(('product', 'user', 'order'), counts):
+            per_entity[kind], build_seconds[kind] = population.grow(kind, target, args.memory_sample)
+        entry.update(products=len(shop.products), users=len(shop.users), orders=len(shop.orders))
+        entry['bytes_per_entity'] = {k: round(v) if v is not None else None for k, v in per_entity.items()}
+        entry['build_s'] = {k: round(v, 2) for k, v in build_seconds.items()}
+        entry['rss_mb'] = round((rss_bytes() - base_rss) / 1e6, 1)
+        entry['operations'] = measure(shop, population, scale, args.calls, rng)
+        report['scales'].append(entry)
+        log(f"{scale}: done, +{entry['rss_mb']:.0f} MB RSS")
+
+    runs = [r for r in report['scales'] if 'operations' in r]
+    report['slopes'] = {op: slope([(r['products'], r['operations'][op]['mean_us']) for r in runs])
+                        for op in OPERATIONS}
+    if args.plot:
+        report['plot'] = args.plot if plot(report, args.plot) else None
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"\nmean latency per call (µs), {args.calls} calls per cell")
+    print(f"{'operation':<20}" + ''.join(f"{r['scale']:>10}" for r in runs) + f"{'slope':>8}")
+    for op in OPERATIONS:
+        cells = ''.join(f"{r['operations'][op]['mean_us']:>10.2f}" for r in runs)
+        s = report['slopes'][op]
+        print(f'{op:<20}{cells}{s if s is not None else "-":>8}')
+    print('\nmemory per entity (bytes, tracemalloc sample)')
+    print(f"{'entity':<20}" + ''.join(f"{r['scale']:>10}" for r in runs))
+    for kind in ('product', 'user', 'order'):
+        cells = ''.join(f"{r['bytes_per_entity'][kind] or '-':>10}" for r in runs)
+        print(f'{kind:<20}{cells}')
+    print(f"{'rss (MB)':<20}" + ''.join(f"{r['rss_mb']:>10.0f}" for r in runs))
+    for r in report['scales']:
+        if 'skipped' in r:
+            print(f"{r['scale']}: skipped, {r['skipped']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Full-text search latency at catalog scale, without HTTP.
+
+Builds a ProductCatalog with N synthetic products (the same names and
+categories as microbench.py), every 7th one on offer, then times
+ProductCatalog.search for single-term, multi-term and filtered queries and
+reports mean/p50/p99 per query in milliseconds. The first call of every
+query is left out: it builds the cached term bitmaps.
+
+Usage:
+    python benchmarks/search_bench.py [--products 1000000] [--calls 50] [--json]
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Product, ProductCatalog  # noqa: E402
+from microbench import CATEGORIES, WORDS  # noqa: E402
+
+QUERIES = {
+    'laptop': ('laptop', {}),
+    'laptop phone': ('laptop phone', {}),
+    'electronics laptop': ('electronics laptop', {}),
+    'laptop category+max_price': ('laptop', {'category': 'Electronics', 'max_price': 300}),
+    'laptop offers_only': ('laptop', {'offers_only': True}),
+    'laptop page 10': ('laptop', {'offset': 240}),
+    'rare term': ('4242', {}),
+}
+
+
+def build(count):
+    catalog = ProductCatalog()
+    for i in range(count):
+        name = f'{WORDS[i % len(WORDS)]} {WORDS[i // len(WORDS) % len(WORDS)]} {i % 10007}'
+        product = Product(1_000_000 + i, name, 5 + i % 995, 1_000_000, CATEGORIES[i % len(CATEGORIES)])
+        if i % 7 == 0:
+            product.set_offer(10, None)
+        catalog.add(product)
+    return catalog
+
+
+def timed(calls, op):
+    op()
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter_ns()
+        op()
+        samples.append((time.perf_counter_ns() - t0) / 1e6)
+    samples.sort()
+    return {
+        'mean_ms': round(sum(samples) / calls, 3),
+        'p50_ms': round(samples[calls // 2], 3),
+        'p99_ms': round(samples[min(calls - 1, math.ceil(calls * 0.99) - 1)], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search latency at catalog scale.')
+    parser.add_argument('--products', type=int, default=1_000_000)
+    parser.add_argument('--calls', type=int, default=50, help='timed calls per query')
+    parser.add_argument('--json', action='store_true', help='print machine-readable results')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    catalog = build(args.products)
+    built = time.perf_counter() - started
+
+    results = {}
+    for label, (query, kwargs) in QUERIES.items():
+        page, _ = catalog.search(query, **kwargs)
+        results[label] = dict(timed(args.calls, lambda: catalog.search(query, **kwargs)), hits=len(page))
+
+    if args.json:
+        print(json.dumps({'products': args.products, 'build_s': round(built, 1), 'queries': results}, indent=2))
+        return
+    print(f'{args.products:,} products (built in {built:.1f}s), {args.calls} calls per query')
+    print(f"{'query':<28} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'page':>5}")
+    for label, r in results.items():
+        print(f"{label:<28} {r['mean_ms']:>9.3f} {r['p50_ms']:>9.3f} {r['p99_ms']:>9.3f} {r['hits']:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Concurrency stress test for ShopSystem.checkout stock reservation.
+
+Runs many threads against one ShopSystem without HTTP:
+
+1. Oversell check: every thread keeps buying the same scarce product until
+   it runs out. Units sold (from the orders) must equal the stock that
+   disappeared, and the stock must never go below zero.
+2. Throughput check: each thread buys from its own product. The storage
+   write is made artificially slow (like a real fsync/DB round-trip) so
+   lock hold time dominates; with per-product lock striping the checkouts
+   overlap and throughput grows with threads, while a single stripe
+   (the equivalent of one global lock) stays flat.
+3. Failure checks: when every attempt to finalize an order raises, the
+   reserved stock and the customer's cart must come back; and an order whose
+   process stopped between checkout and finalize must still be created when
+   the journal is loaded again, with its stock taken once.
+
+Usage:
+    python benchmarks/stress_checkout.py [--threads 16] [--seconds 2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import Product, ShopSystem, StockReserver  # noqa: E402
+from journal import JournalStorage  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+
+
+class SlowStorage(MemoryStorage):
+    def __init__(self, write_latency):
+        super().__init__()
+        self.write_latency = write_latency
+
+    def update_product(self, p_id, fields):
+        time.sleep(self.write_latency)
+
+
+def make_shop(storage=None, stripes=64):
+    shop = ShopSystem(storage)
+    shop.stock = StockReserver(shop.products, shop.storage, stripes=stripes)
+    return shop
+
+
+def run_oversell(threads, stock=500):
+    shop = make_shop()
+    product = shop.get_product_by_id(101)
+    product.stock = stock
+    shop.products.reindex(product)
+    start = threading.Barrier(threads)
+    rejected = [0] * threads
+
+    def worker(n):
+        user = shop.register(f"stress{n}", "x")
+        start.wait()
+        while True:
+            user.cart.clear()
+            user.cart.add(product, 1 + n % 3)
+            ok, _ = shop.checkout(user, "addr", "Online Payment")
+            if not ok:
+                rejected[n] += 1
+                if product.stock == 0 or rejected[n] > 50:
+                    return
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool: t.start()
+    for t in pool: t.join()
+
+    sold = sum(int(item.rsplit("x", 1)[1]) for o in shop.orders for item in o.items_txt)
+    ids = [o.order_id for o in shop.orders]
+    print(f"oversell: initial={stock} sold={sold} final_stock={product.stock} orders={len(ids)}")
+    assert product.stock >= 0, "stock went negative"
+    assert sold + product.stock == stock, "units sold do not match the stock decrement"
+    assert len(set(ids)) == len(ids), "duplicate order ids"
+
+
+def run_failed_finalize():
+    shop = ShopSystem(order_workers=1)
+    product = shop.get_product_by_id(101)
+    stock = product.stock
+
+    def broken(job):
+        raise RuntimeError("finalize failed")
+
+    shop.pipeline._finalize = broken
+    user = shop.register("failing", "x")
+    shop.add_to_cart(user, product, 2)
+    ok, (order_id, _) = shop.checkout(user, "addr", "Online Payment")
+    assert ok and product.stock == stock - 2, "checkout did not reserve the stock"
+    shop.pipeline.join()
+
+    status = shop.order_status(user, order_id)
+    print(f"failed finalize: state={status['state']} stock={product.stock}/{stock} cart={user.cart_lines()}")
+    assert status['state'] == 'failed', "order was not marked failed"
+    assert product.stock == stock, "reserved stock was not released"
+    assert user.cart_lines() == [[101, 2]], "cart was not restored"
+    assert order_id not in shop.orders, "failed order was recorded"
+
+
+def run_crash_recovery():
+    with tempfile.TemporaryDirectory() as directory:
+        shop = ShopSystem(JournalStorage(directory, snapshot_interval=0), order_workers=1)
+        shop.pipeline.submit = lambda order_id, customer, job: None   # stops before finalize
+        user = shop.register("crashing", "x")
+        shop.add_to_cart(user, shop.get_product_by_id(102), 1)
+        ok, (order_id, _) = shop.checkout(user, "addr", "Online Payment")
+        assert ok
+        stock = shop.get_product_by_id(102).stock
+
+        for snapshot in (False, True):
+            if snapshot:
+                shop.storage.snapshot()
+            restarted = ShopSystem(JournalStorage(directory, snapshot_interval=0))
+            recovered = restarted.get_product_by_id(102).stock
+            print(f"crash recovery ({'snapshot' if snapshot else 'journal'}): "
+                  f"order={order_id in restarted.orders} stock={recovered}/{stock}")
+            assert order_id in restarted.orders, "pending order was lost"
+            assert recovered == stock, "recovered order changed the stock again"
+            assert not restarted.get_user("crashing").cart, "cart came back after the order"
+            restarted.storage.close()
+
+
+def run_throughput(threads, seconds, stripes, write_latency):
+    shop = make_shop(SlowStorage(write_latency), stripes=stripes)
+    products = []
+    for n in range(threads):
+        p = shop.products.add(Product(900000 + n, f"Stress item {n}", 10, 10 ** 9, "Stress"))
+        products.append(p)
+    counts = [0] * threads
+    start = threading.Barrier(threads + 1)
+    deadline = [0.0]
+
+    def worker(n):
+        user = shop.register(f"tp{n}", "x")
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            user.cart.add(products[n], 1)
+            ok, _ = shop.checkout(user, "addr", "Online Payment")
+            counts[n] += ok
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool: t.start()
+    deadline[0] = time.perf_counter() + seconds
+    start.wait()
+    for t in pool: t.join()
+    return sum(counts) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--write-latency", type=float, default=0.001,
+                        help="simulated storage write latency in seconds")
+    args = parser.parse_args()
+
+    run_oversell(args.threads)
+    run_failed_finalize()
+    run_crash_recovery()
+
+    print(f"\nthroughput on disjoint products (checkouts/s, write latency {args.write_latency * 1000:.1f} ms)")
+    print(f"{'threads':>8} {'striped':>10} {'global':>10} {'speedup':>8}")
+    levels = [n for n in (1, 2, 4, 8, 16, 32) if n <= args.threads]
+    base = None
+    for n in levels:
+        striped = run_throughput(n, args.seconds, 64, args.write_latency)
+        single = run_throughput(n, args.seconds, 1, args.write_latency)
+        base = base or striped
+        print(f"{n:>8} {striped:>10.0f} {single:>10.0f} {striped / base:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
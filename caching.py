@@ -0,0 +1,127 @@
+import re
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup, escape
+
+# ==============================================================================
+#                        كاش الصفحات المعروضة (Response Cache)
+# ==============================================================================
+# صفحات الكتالوج تتغير فقط مع تعديل المنتجات، فتُحفظ بعد عرضها بمفتاح
+# (المسار، الاستعلام، إصدار الكتالوج). أي تعديل يرفع الإصدار فتصبح المفاتيح
+# القديمة غير قابلة للوصول وتخرج مع الوقت بسياسة LRU.
+#
+# الأجزاء الخاصة بكل مستخدم (الاسم، عدد السلة) تُعرض كعلامات <!--slot:name-->
+# في النسخة المحفوظة (bytes بترميز UTF-8)، وتُستبدل بقيم المستخدم الحالي عند كل رد.
+
+_SLOT = re.compile(rb'<!--slot:(\w+)-->')
+
+
+def slot_marker(name):
+    return Markup(f'<!--slot:{name}-->')
+
+
+def splice(body, values):
+    # القيم تُهرَّب هنا لأنها لم تمر على Jinja
+    return _SLOT.sub(lambda m: str(escape(values.get(m.group(1).decode(), ''))).encode('utf-8'), body)
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> body (bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        size = len(body)
+        if not self.max_entries or size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# ==============================================================================
+#                    كاش أجزاء الصفحة لكل منتج (Fragment Cache)
+# ==============================================================================
+# بطاقة المنتج وصفوف جدول الإدارة لا تعتمد إلا على المنتج نفسه، فتُحفظ بمفتاح
+# (النوع، المعرف) مع إصدار المنتج عند عرضها. تعديل منتج واحد يرفع إصداره فيُعاد
+# عرض جزئه وحده، ولكل منتج نسخة واحدة لكل نوع فلا تتراكم النسخ القديمة.
+
+class FragmentCache:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._entries = {}   # (kind, id) -> (version, html)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def render(self, kind, key, version, render):
+        # الإصدار يُقرأ قبل العرض: تعديل أثناء العرض يرفعه فيُعاد العرض في المرة التالية
+        if not self.enabled:
+            return render()
+        entry = self._entries.get((kind, key))
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        html = Markup(render())
+        self._entries[(kind, key)] = (version, html)
+        return html
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+import math
+
+# ==============================================================================
+#                  استيراد وتصدير الكتالوج (CSV / JSONL) بالتدفق
+# ==============================================================================
+# الاستيراد يقرأ سطراً بسطر ويتحقق من كل سطر، ويرسل الصفوف السليمة إلى
+# ShopSystem.upsert_products على دفعات بحجم chunk_size، فلا يبقى في الذاكرة
+# أكثر من دفعة واحدة مهما كبر الملف. التصدير مولّد يعطي النص على أجزاء.
+# ملف لا يمكن قراءته بعد نقطة ما (ترميز غير UTF-8، CSV تالف) يوقف الاستيراد هناك:
+# ما قبلها حُفظ فعلاً، والتقرير يقول ذلك صراحة (partial).
+#
+# الأعمدة: id, name, price, stock, category مطلوبة في كل سطر؛
+# offer_discount, offer_gift, offer_limit اختيارية (بدون عرض إذا غابت).
+
+FIELDS = ('id', 'name', 'price', 'stock', 'category', 'offer_discount', 'offer_gift', 'offer_limit')
+FORMATS = ('csv', 'jsonl')
+MAX_ERRORS = 100
+
+
+def detect_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def _number(value, kind):
+    # من CSV تصل نصوصاً ومن JSON أرقاماً؛ الأعداد الصحيحة تبقى int كما في بيانات البذرة
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, str):
+        value = value.strip()
+        value = int(value) if value.lstrip('-').isdigit() else float(value)
+    if not math.isfinite(value):
+        raise ValueError
+    if kind is int:
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        return int(value)
+    return value
+
+
+def validate(raw):
+    # يعيد صف منتج كامل بالأنواع الصحيحة، أو يرفع ValueError برسالة تصف المشكلة
+    if not isinstance(raw, dict):
+        raise ValueError("السطر ليس كائناً")
+
+    def field(name, kind, required=True, default=None):
+        value = raw.get(name)
+        if value is None or value == '':
+            if required:
+                raise ValueError(f"الحقل {name} مطلوب")
+            return default
+        try:
+            return _number(value, kind) if kind in (int, float) else str(value).strip()
+        except (TypeError, ValueError):
+            raise ValueError(f"قيمة غير صالحة للحقل {name}: {value!r}")
+
+    row = {
+        'id': field('id', int),
+        'name': field('name', str),
+        'price': field('price', float),
+        'stock': field('stock', int),
+        'category': field('category', str),
+        'offer_discount': field('offer_discount', float, False, 0),
+        'offer_gift': field('offer_gift', str, False, None) or None,
+        'offer_limit': field('offer_limit', int, False, 0),
+    }
+    if row['id'] <= 0:
+        raise ValueError("id يجب أن يكون موجباً")
+    if not row['name'] or not row['category']:
+        raise ValueError("الاسم والتصنيف لا يكونان فارغين")
+    if row['price'] < 0 or row['stock'] < 0 or row['offer_limit'] < 0:
+        raise ValueError("السعر والمخزون والحد لا تكون سالبة")
+    if not 0 <= row['offer_discount'] <= 100:
+        raise ValueError("نسبة الخصم بين 0 و 100")
+    return row
+
+
+def read_rows(stream, fmt):
+    # stream نصي؛ يعطي (رقم السطر، الصف كما قُرئ أو None إذا تعذرت قراءته، رسالة الخطأ)
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for raw in reader:
+            yield reader.line_num, raw, None
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line), None
+            except ValueError:
+                yield line_no, None, "JSON غير صالح"
+    else:
+        raise ValueError(f"Unknown catalog format: {fmt}")
+
+
+def import_catalog(shop, stream, fmt, chunk_size=1000):
+    # يعيد تقريراً: عدد المضاف والمحدث والمرفوض مع أول MAX_ERRORS خطأ
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0, 'errors': [], 'partial': False,
+              'stopped_at': None}
+    chunk = []
+    line_no = 0
+
+    def flush():
+        created, updated = shop.upsert_products(chunk)
+        report['created'] += created
+        report['updated'] += updated
+        report['unchanged'] += len(chunk) - created - updated
+        chunk.clear()
+
+    def stop(message):
+        report['partial'] = True
+        report['stopped_at'] = line_no + 1
+        report['errors'].append({'line': line_no + 1, 'message': message})
+
+    try:
+        for line_no, raw, error in read_rows(stream, fmt):
+            if error is None:
+                try:
+                    chunk.append(validate(raw))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                report['rejected'] += 1
+                if len(report['errors']) < MAX_ERRORS:
+                    report['errors'].append({'line': line_no, 'message': error})
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+    except UnicodeDecodeError:
+        stop("الملف ليس نصاً بترميز UTF-8؛ توقف الاستيراد هنا")
+    except csv.Error as e:
+        stop(f"CSV تالف ({e})؛ توقف الاستيراد هنا")
+    # الأسطر السليمة قبل نقطة التوقف تُحفظ، فالتقرير يطابق ما في الكتالوج
+    if chunk:
+        flush()
+    return report
+
+
+def export_catalog(products, fmt, chunk_size=500):
+    # مولّد نصوص: كل جزء حتى chunk_size منتج، فلا يُبنى الملف كاملاً في الذاكرة
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown catalog format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(FIELDS)
+    count = 0
+    for product in products:
+        row = product.to_row()
+        if writer:
+            writer.writerow([row[f] if row[f] is not None else '' for f in FIELDS])
+        else:
+            buffer.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# ==============================================================================
+#                   تحديثات المخزون والعروض الحية (Server-Sent Events)
+# ==============================================================================
+# كل تعديل على منتج يمر على ProductCatalog.reindex يُسجَّل هنا كمعرف فقط.
+# خيط واحد يجمع التعديلات كل tick ثانية ويحولها إلى حدث واحد: قائمة فروق صغيرة
+# بآخر حالة لكل منتج (عشر عمليات شراء لنفس المنتج في tick = فرق واحد).
+#
+# الأحداث تُحفظ في حلقة (ring buffer) بأرقام متسلسلة، وكل مشترك مجرد رقم آخر حدث
+# وصله: النشر لا يمر على المشتركين، وكلهم ينتظرون نفس الـ Condition. لذلك
+# آلاف الاتصالات الخاملة لا تكلف خيطاً لكل منها ما دام الخادم يعطي كل اتصال
+# greenlet (عامل gevent في gunicorn.conf.py).
+#
+# المشترك الذي يعود بـ Last-Event-ID أقدم من الحلقة، أو من عملية أخرى، أو
+# حدث فيه تغير أكبر من max_deltas يستلم حدث reset فيعيد جلب ما يعرضه.
+
+RETRY_MS = 3000
+
+
+class EventBroker:
+    def __init__(self, snapshot, tick=0.25, history=1024, max_deltas=500, poll=None):
+        self._snapshot = snapshot     # Product -> dict الفرق المرسل للعملاء
+        self.tick = tick
+        self.max_deltas = max_deltas
+        self._poll = poll             # يُستدعى كل tick ما دام هناك مشتركون (التقاط تغييرات العمليات الأخرى)
+        self.token = os.urandom(4).hex()
+        self._pending = {}            # product_id -> Product بانتظار الـ tick التالي
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sent = {}               # product_id -> آخر فرق أُرسل (لإسقاط التعديلات التي لا تظهر للعميل)
+        self._events = deque(maxlen=history)   # (seq, event, data)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._listeners = []          # تُستدعى بعد كل حدث من خيط النشر (مثلاً لإيقاظ حلقة asyncio)
+        self.subscribers = 0
+        self.published = 0
+
+    # ----------------------------- النشر -----------------------------
+
+    def publish(self, product):
+        # يُستدعى تحت قفل الكتالوج، فيبقى مجرد إسناد في قاموس
+        with self._pending_lock:
+            self._pending[product.id] = product
+        self._wake.set()
+        self._start()
+
+    def _start(self):
+        # الخيط يبدأ عند أول استعمال (بعد fork في عمال gunicorn)
+        if self._thread is None:
+            with self._pending_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            # بدون مشتركين (أو بدون تخزين مشترك) لا داعي للاستيقاظ إلا عند تعديل محلي
+            woke = self._wake.wait(self.tick if self.subscribers and self._poll else None)
+            if self._closed:
+                return
+            if woke:
+                time.sleep(self.tick)   # نترك التعديلات المتتالية تتجمع في حدث واحد
+                self._wake.clear()
+            if self.subscribers and self._poll:
+                try:
+                    self._poll()
+                except Exception:
+                    pass   # تعذر التزامن مؤقتاً؛ نحاول في الـ tick التالي
+            self.flush()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        if len(pending) > self.max_deltas:
+            # تعديل جماعي: حدث واحد يطلب إعادة الجلب بدل آلاف الفروق
+            self._sent.clear()
+            self._emit('reset', '{}')
+            return
+        deltas = []
+        for p_id, product in pending.items():
+            delta = self._snapshot(product)
+            if self._sent.get(p_id) != delta:
+                self._sent[p_id] = delta
+                deltas.append(delta)
+        if deltas:
+            self._emit('products', json.dumps(deltas, ensure_ascii=False, separators=(',', ':')))
+
+    def _emit(self, event, data):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, data))
+            self.published += 1
+            self._cond.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    # ----------------------------- الاشتراك -----------------------------
+
+    def _parse_id(self, last_id):
+        # المعرف "token:seq"؛ معرف من عملية أخرى أو تشغيل سابق = None
+        token, _, seq = (last_id or '').partition(':')
+        if token != self.token or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _since(self, seq):
+        # الأحداث بعد seq، أو None إذا خرج ما بعده من الحلقة
+        if seq > self._seq:
+            return None
+        if seq == self._seq:
+            return []
+        if not self._events or self._events[0][0] > seq + 1:
+            return None
+        return [e for e in self._events if e[0] > seq]
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def listen(self, callback):
+        self._listeners.append(callback)
+
+    def subscribe(self, last_id=None):
+        # للمشتركين خارج stream() (خادم ASGI): يعيد رقم البداية أو None (يحتاج reset)
+        self._start()
+        with self._cond:
+            self.subscribers += 1
+            seq = self._seq if not last_id else self._parse_id(last_id)
+        self._wake.set()
+        return seq
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def poll(self, seq):
+        # (نص SSE للأحداث بعد seq، الرقم الجديد)؛ بدون انتظار
+        with self._cond:
+            events = self._since(seq) if seq is not None else None
+            current = self._seq
+        if events is None:
+            return self._format(current, 'reset', '{}'), current
+        if events:
+            return ''.join(self._format(*e) for e in events), events[-1][0]
+        return '', seq
+
+    def last_event_id(self):
+        # تُضمَّن في الصفحة عند عرضها فيبدأ الاشتراك من لحظة العرض لا من لحظة الاتصال
+        return f'{self.token}:{self._seq}'
+
+    def _format(self, seq, event, data):
+        return f'id: {self.token}:{seq}\nevent: {event}\ndata: {data}\n\n'
+
+    def stream(self, last_id=None, heartbeat=15.0, max_age=None):
+        # مولّد نصوص SSE. max_age يغلق الاتصال دورياً ليعيد المتصفح الاتصال
+        # (بنفس Last-Event-ID) فلا يبقى العامل محجوزاً بلا حد مع العمال المتزامنة
+        started = time.monotonic()
+        seq = self.subscribe(last_id)
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            while True:
+                with self._cond:
+                    if seq is not None and seq == self._seq:
+                        self._cond.wait(heartbeat)
+                text, seq = self.poll(seq)
+                yield text or ': ping\n\n'
+                if self._closed or (max_age and time.monotonic() - started > max_age):
+                    return
+        finally:
+            self.unsubscribe()
+
+    def stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'seq': self._seq,
+            'history': len(self._events),
+            'published': self.published,
+            'tick': self.tick,
+        }
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
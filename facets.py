@@ -0,0 +1,169 @@
+import threading
+
+# ==============================================================================
+#                      فلاتر متعددة بخرائط البتات (Bitmap Facets)
+# ==============================================================================
+# لكل قيمة فلتر خريطة بتات: البت رقم n مرفوع إذا كان المنتج في الموقع n من
+# ProductCatalog يحقق القيمة. تُحفظ كـ bytearray فيكون تعديل بت واحد (خصم مخزون،
+# تغيير عرض) في مكانه دون نسخ، وعند الاستعلام تتحول إلى int: الجمع بين الفلاتر
+# AND بين الأعداد وعدد النتائج bit_count()، وكلاهما يجري في C دون المرور على كائنات Product.
+
+# حدود فئات السعر (على السعر الفعلي بعد الخصم)؛ الفئة الأخيرة مفتوحة
+PRICE_BANDS = (25, 50, 100, 250, 500)
+
+FLAGS = ('in_stock', 'has_offer', 'has_gift')
+
+_CHUNK = 4096            # عدد البتات في كل نافذة
+_CHUNK_MASK = (1 << _CHUNK) - 1
+
+
+def price_band(price):
+    for band, upper in enumerate(PRICE_BANDS):
+        if price < upper:
+            return band
+    return len(PRICE_BANDS)
+
+
+def band_label(band):
+    if band == 0:
+        return f"أقل من {PRICE_BANDS[0]}$"
+    if band == len(PRICE_BANDS):
+        return f"{PRICE_BANDS[-1]}$ فأكثر"
+    return f"{PRICE_BANDS[band - 1]}$ - {PRICE_BANDS[band]}$"
+
+
+def bands_between(min_price=None, max_price=None):
+    # الفئات التي تتقاطع مع المدى [min_price, max_price]
+    low = 0 if min_price is None else price_band(min_price)
+    high = len(PRICE_BANDS) if max_price is None else price_band(max_price)
+    return range(low, high + 1)
+
+
+def _set_bit(bits, pos, on):
+    index = pos >> 3
+    if index >= len(bits):
+        bits.extend(bytes(index + 1 - len(bits)))
+    if on:
+        bits[index] |= 1 << (pos & 7)
+    else:
+        bits[index] &= ~(1 << (pos & 7)) & 0xFF
+
+
+def _as_int(bits):
+    return int.from_bytes(bits, 'little') if bits is not None else 0
+
+
+def iter_positions(bitmap, start=0):
+    # مواقع البتات المرفوعة بالترتيب ابتداءً من start، على نوافذ صغيرة
+    # فلا ندفع ثمن إزاحة العدد الكبير كاملاً إلا مرة لكل نافذة
+    bitmap >>= start
+    base = start
+    while bitmap:
+        window = bitmap & _CHUNK_MASK
+        if not window:
+            # قفزة مباشرة إلى البت التالي في المناطق الفارغة
+            skip = (bitmap & -bitmap).bit_length() - 1
+            bitmap >>= skip
+            base += skip
+            continue
+        while window:
+            low = window & -window
+            yield base + low.bit_length() - 1
+            window ^= low
+        bitmap >>= _CHUNK
+        base += _CHUNK
+
+
+class FacetIndex:
+    def __init__(self):
+        self._all = bytearray()
+        self._category = {}                   # التصنيف -> bits
+        self._band = {}                       # فئة السعر -> bits
+        self._flags = {flag: bytearray() for flag in FLAGS}
+        self._keys = {}                       # موقع -> (تصنيف، فئة، متوفر، عرض، هدية)
+        self._ints = {}                       # نسخة int محفوظة من كل خريطة حتى تتغير
+        self._lock = threading.Lock()
+
+    def _int(self, kind, key, bits):
+        # قيم الفلاتر تأتي من الرابط (?category=، ?price_band=): القيمة غير الموجودة
+        # لا تُحفظ، وإلا صار كل رابط عشوائي مدخلاً دائماً في _ints
+        if bits is None:
+            return 0
+        value = self._ints.get((kind, key))
+        if value is None:
+            with self._lock:
+                value = self._ints[(kind, key)] = _as_int(bits)
+        return value
+
+    def update(self, pos, category, band, in_stock, has_offer, has_gift):
+        new = (category, band, in_stock, has_offer, has_gift)
+        with self._lock:
+            old = self._keys.get(pos)
+            if old == new:
+                return
+            touched = []
+            if old is None:
+                _set_bit(self._all, pos, True)
+                touched.append(('all', None))
+            if old is None or old[0] != category:
+                if old is not None:
+                    _set_bit(self._category[old[0]], pos, False)
+                    touched.append(('category', old[0]))
+                _set_bit(self._category.setdefault(category, bytearray()), pos, True)
+                touched.append(('category', category))
+            if old is None or old[1] != band:
+                if old is not None:
+                    _set_bit(self._band[old[1]], pos, False)
+                    touched.append(('band', old[1]))
+                _set_bit(self._band.setdefault(band, bytearray()), pos, True)
+                touched.append(('band', band))
+            for i, flag in enumerate(FLAGS, 2):
+                if old is None or old[i] != new[i]:
+                    _set_bit(self._flags[flag], pos, new[i])
+                    touched.append(('flag', flag))
+            for key in touched:
+                self._ints.pop(key, None)
+            self._keys[pos] = new
+
+    def categories(self):
+        return [c for c in list(self._category) if self.category(c)]
+
+    def category(self, category):
+        return self._int('category', category, self._category.get(category))
+
+    def flag(self, flag):
+        return self._int('flag', flag, self._flags[flag])
+
+    def band(self, band):
+        return self._int('band', band, self._band.get(band))
+
+    def select(self, category=None, bands=None, **flags):
+        # AND بين الفلاتر المطلوبة؛ bands مجموعة فئات سعر (OR بينها)
+        bitmap = self._int('all', None, self._all)
+        if category is not None:
+            bitmap &= self.category(category)
+        if bands is not None:
+            union = 0
+            for band in bands:
+                union |= self.band(band)
+            bitmap &= union
+        for flag, wanted in flags.items():
+            if wanted:
+                bitmap &= self.flag(flag)
+        return bitmap
+
+    def counts(self, category=None, bands=None, **flags):
+        # عدد النتائج لكل قيمة مع بقية الفلاتر المختارة (دون فلتر المجموعة نفسها)
+        without_category = self.select(None, bands, **flags)
+        without_bands = self.select(category, None, **flags)
+        counts = {
+            'category': {c: (self.category(c) & without_category).bit_count()
+                         for c in list(self._category)},
+            'price_band': {band: (self.band(band) & without_bands).bit_count()
+                           for band in range(len(PRICE_BANDS) + 1)},
+            'total': self.select(category, bands, **flags).bit_count(),
+        }
+        for flag in FLAGS:
+            others = self.select(category, bands, **dict(flags, **{flag: False}))
+            counts[flag] = (self.flag(flag) & others).bit_count()
+        return counts
@@ -0,0 +1,28 @@
+import os
+
+# ==============================================================================
+#                           إعدادات gunicorn
+# ==============================================================================
+# gunicorn يقرأ هذا الملف تلقائياً من مجلد التشغيل، فيكفي `gunicorn app:app`
+# كما في Procfile ومنصات النشر.
+#
+# اتصالات /api/stream (التحديثات الحية) مفتوحة طوال بقاء الصفحة، والعامل
+# المتزامن الافتراضي يخدم طلباً واحداً في كل مرة. عامل gevent يعطي كل اتصال
+# greenlet بدل خيط، فتبقى آلاف الاتصالات الخاملة رخيصة. بدون gevent نرجع إلى
+# gthread: كل اتصال يحجز خيطاً حتى SHOP_STREAM_MAX_SECONDS، فنحدد عدد اتصالات
+# البث لكل عامل بنصف الخيوط (SHOP_STREAM_MAX_CONNECTIONS) ليبقى الباقي للصفحات
+# والشراء. العامل المتزامن بخيط واحد لا يبث أصلاً (الحد 0).
+
+try:
+    import gevent  # noqa: F401
+    _DEFAULT_WORKER = 'gevent'
+except ImportError:
+    _DEFAULT_WORKER = 'gthread'
+
+worker_class = os.environ.get('SHOP_WORKER_CLASS', _DEFAULT_WORKER)
+worker_connections = int(os.environ.get('SHOP_WORKER_CONNECTIONS', 2000))
+threads = int(os.environ.get('SHOP_WORKER_THREADS', 8))
+
+if worker_class in ('sync', 'gthread'):
+    # يُقرأ في app.py داخل العامل؛ قيمة صريحة في البيئة تغلب هذا الافتراض
+    os.environ.setdefault('SHOP_STREAM_MAX_CONNECTIONS', str(threads // 2))
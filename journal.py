@@ -0,0 +1,315 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from storage import MemoryStorage
+
+# ==============================================================================
+#               سجل الكتابة المسبقة واللقطات (Write-Ahead Journal)
+# ==============================================================================
+# الحالة تبقى في الذاكرة كما في MemoryStorage، لكن كل تغيير يُلحق كسطر JSON
+# في ملفات journal-<seq>.log قبل الرد على الطلب، ولقطة snapshot.json تُكتب دورياً.
+# عند التشغيل: نحمّل آخر لقطة ثم نعيد تطبيق ما بعدها من السجل.
+#
+# كل سطر: {"seq": n, "label": "checkout", "ops": [[op, ...], ...]}
+#   ["user", row]                  تسجيل مستخدم
+#   ["cart", username, lines]      محتوى السلة بعد التغيير
+#   ["product", p_id, fields]      قيم مطلقة للحقول المتغيرة (اسم، سعر، مخزون، عرض)
+#   ["pending", row]               طلب حُجز مخزونه وينتظر الإنشاء في الخلفية
+#   ["order", row]                 طلب جديد (ينهي الطلب المعلق بنفس الرقم)
+#   ["cancel", order_id]           طلب معلق أُلغي بعد فشل إنشائه
+#   ["ids", name, next]            كتلة أرقام أُعطيت: العداد لا يرجع تحت next
+# العمليات قيم مطلقة لا فروق، لذلك إعادة تطبيق سطر مطبّق مسبقاً لا تغير شيئاً.
+
+
+class JournalStorage(MemoryStorage):
+    def __init__(self, directory, snapshot_every=10000, snapshot_interval=60.0):
+        super().__init__()
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._seq = 0               # آخر رقم تسلسل أُعطي لسطر
+        self._flushed = 0           # آخر رقم وصل القرص (fsync)
+        self._pending = []          # أسطر بانتظار الكتابة الجماعية
+        self._flushing = False
+        self._active = 0            # دفعات بدأت ولم تُسجَّل بعد
+        self._capturing = False     # لقطة تنتظر لحظة هدوء
+        self._snapshot_seq = 0
+        self._file = None
+        self._rotate = True
+        self._export = None
+        self._closed = False
+        self._failed = None         # خطأ كتابة السجل (ENOSPC/EIO): بعده لا نقبل تغييرات
+        self._snapshot_lock = threading.Lock()
+        self._snapshotter = None
+
+    # ----------------------------- الاسترجاع -----------------------------
+
+    def load(self):
+        snapshot_path = os.path.join(self.directory, 'snapshot.json')
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        else:
+            snapshot = None
+
+        records = list(self._read_journal())
+        if snapshot is None and not records:
+            return None
+
+        state = snapshot['state'] if snapshot else {'products': [], 'users': [], 'orders': []}
+        self._snapshot_seq = snapshot['seq'] if snapshot else 0
+        counters = dict(snapshot.get('counters', {})) if snapshot else {}
+        products = {row['id']: row for row in state['products']}
+        users = {row['username']: row for row in state['users']}
+        orders = {row['order_id']: row for row in state['orders']}
+        pending = {row['order_id']: row for row in state.get('pending', [])}
+        last = self._snapshot_seq
+        for record in records:
+            last = max(last, record['seq'])
+            if record['seq'] <= self._snapshot_seq:
+                continue
+            for op in record['ops']:
+                if op[0] == 'user':
+                    users[op[1]['username']] = op[1]
+                elif op[0] == 'cart' and op[1] in users:
+                    users[op[1]]['cart'] = op[2]
+                elif op[0] == 'product':
+                    products.setdefault(op[1], {'id': op[1]}).update(op[2])
+                elif op[0] == 'pending':
+                    pending[op[1]['order_id']] = op[1]
+                elif op[0] == 'order':
+                    orders[op[1]['order_id']] = op[1]
+                    pending.pop(op[1]['order_id'], None)
+                elif op[0] == 'cancel':
+                    pending.pop(op[1], None)
+                elif op[0] == 'ids':
+                    counters[op[1]] = max(counters.get(op[1], 1), op[2])
+        self._counters.update(counters)
+        self._seq = self._flushed = last
+        return {
+            'rev': 0,
+            'products': list(products.values()),
+            'users': list(users.values()),
+            'orders': list(orders.values()),
+            'pending': [row for o_id, row in pending.items() if o_id not in orders],
+        }
+
+    def _read_journal(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, 'journal-*.log'))):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # سطر مبتور من توقف مفاجئ أثناء الكتابة: آخر ما في الملف
+                        break
+
+    def seed(self, state):
+        self._write_snapshot(self._seq, state)
+        return None
+
+    def bind(self, export_state):
+        # ShopSystem يعطينا طريقة تصدير حالته لنكتب منها اللقطات الدورية
+        self._export = export_state
+        if self._snapshotter is None and self.snapshot_interval:
+            self._snapshotter = threading.Thread(target=self._snapshot_loop, name='journal-snapshot', daemon=True)
+            self._snapshotter.start()
+
+    # ----------------------------- التسجيل -----------------------------
+
+    @contextmanager
+    def batch(self, label=None):
+        if getattr(self._local, 'ops', None) is not None:
+            yield
+            return
+        with self._cond:
+            self._check()
+            while self._capturing:
+                self._cond.wait()
+            self._active += 1
+        self._local.ops = []
+        seq = None
+        try:
+            yield
+            ops = self._local.ops
+            if ops:
+                seq = self._append({'label': label, 'ops': ops})
+        finally:
+            self._local.ops = None
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+        if seq is not None:
+            self._wait_flushed(seq)
+
+    def _record(self, op):
+        if getattr(self._local, 'ops', None) is not None:
+            self._local.ops.append(op)
+        else:
+            with self.batch():
+                self._local.ops.append(op)
+
+    def add_user(self, row):
+        self._record(['user', row])
+        return True
+
+    def save_cart(self, username, lines):
+        self._record(['cart', username, lines])
+
+    def update_product(self, p_id, fields):
+        if fields:
+            self._record(['product', p_id, fields])
+
+    def update_products(self, updates):
+        with self.batch():
+            for p_id, fields in updates:
+                self.update_product(p_id, fields)
+
+    def upsert_products(self, rows):
+        # صف كامل: عند إعادة التطبيق ينشئ المنتج إن لم يكن موجوداً (setdefault)
+        with self.batch():
+            for row in rows:
+                self._record(['product', row['id'], {k: v for k, v in row.items() if k != 'id'}])
+
+    def add_pending_order(self, row):
+        self._record(['pending', row])
+
+    def cancel_pending_order(self, order_id):
+        self._record(['cancel', order_id])
+        return True
+
+    def add_order(self, row):
+        self._record(['order', row])
+        return True
+
+    def allocate_ids(self, name, count, floor=1):
+        # الكتلة تُسجل (وتصل القرص) قبل استعمال أي رقم منها
+        start = super().allocate_ids(name, count, floor)
+        self._record(['ids', name, start + count])
+        return start
+
+    # --------------------------- الكتابة الجماعية ---------------------------
+
+    def _append(self, record):
+        with self._cond:
+            self._seq += 1
+            record['seq'] = self._seq
+            self._pending.append(json.dumps(record, ensure_ascii=False))
+            return self._seq
+
+    def _check(self):
+        if self._failed is not None:
+            raise RuntimeError('journal write failed; changes are no longer persisted') from self._failed
+
+    def _wait_flushed(self, seq):
+        # Group commit: أول منتظر يصبح "القائد" فيكتب كل الأسطر المعلقة ويستدعي fsync
+        # مرة واحدة، والبقية ينتظرون انتهاءه بدل أن يدفع كل طلب fsync خاصاً به.
+        # إذا فشلت الكتابة لا نعرف ما وصل القرص (وقد يبقى سطر مبتور في آخر الملف)،
+        # فيتوقف السجل: القائد وكل منتظر ومن يأتي بعدهم يرفعون الخطأ بدل أن يُعتبر
+        # ما لم يُكتب محفوظاً. الاسترجاع بعد إعادة التشغيل من آخر ما وصل القرص فعلاً.
+        with self._cond:
+            while self._flushed < seq:
+                self._check()
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                lines, self._pending = self._pending, []
+                last = self._seq
+                self._flushing = True
+                self._cond.release()
+                try:
+                    self._write_lines(lines, last - len(lines) + 1)
+                except BaseException as e:
+                    self._cond.acquire()
+                    self._failed = e
+                    self._flushing = False
+                    self._cond.notify_all()
+                    raise
+                self._cond.acquire()
+                self._flushing = False
+                self._flushed = last
+                self._cond.notify_all()
+
+    def _write_lines(self, lines, first_seq):
+        if self._rotate or self._file is None:
+            if self._file is not None:
+                self._file.close()
+            path = os.path.join(self.directory, f'journal-{first_seq:012d}.log')
+            self._file = open(path, 'a', encoding='utf-8')
+            self._rotate = False
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # ----------------------------- اللقطات -----------------------------
+
+    def snapshot(self):
+        if self._export is None:
+            return
+        self._check()
+        with self._snapshot_lock:
+            # ننتظر لحظة لا توجد فيها دفعة مفتوحة: كل سطر حتى seq طُبق في الذاكرة
+            with self._cond:
+                self._capturing = True
+                while self._active:
+                    self._cond.wait()
+                seq = self._seq
+                self._capturing = False
+                self._cond.notify_all()
+                if seq == self._snapshot_seq:
+                    return
+                self._rotate = True
+            # التصدير بعد فك القفل قد يلتقط تغييرات لاحقة، ولا ضرر فإعادة تطبيقها لا تغير شيئاً
+            self._write_snapshot(seq, self._export())
+            self._wait_flushed(seq)
+            self._drop_segments(seq)
+
+    def _write_snapshot(self, seq, state):
+        path = os.path.join(self.directory, 'snapshot.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'seq': seq, 'state': state, 'counters': dict(self._counters)}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._snapshot_seq = seq
+
+    def _drop_segments(self, seq):
+        # الملفات التي يسبق أولُ سطر في الملف التالي لها seq+1 مغطاة كلها باللقطة
+        paths = sorted(glob.glob(os.path.join(self.directory, 'journal-*.log')))
+        for path, next_path in zip(paths, paths[1:]):
+            next_first = int(os.path.basename(next_path)[len('journal-'):-len('.log')])
+            if next_first <= seq + 1:
+                os.remove(path)
+
+    def _snapshot_loop(self):
+        # لقطة كل snapshot_every سطر، أو كل snapshot_interval ثانية إذا تغير شيء
+        last = time.monotonic()
+        while not self._closed and self._failed is None:
+            time.sleep(min(1.0, self.snapshot_interval))
+            behind = self._seq - self._snapshot_seq
+            if behind >= self.snapshot_every or (behind and time.monotonic() - last >= self.snapshot_interval):
+                self.snapshot()
+                last = time.monotonic()
+
+    def close(self):
+        self._closed = True
+        if self._failed is None:
+            self.snapshot()
+        with self._cond:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# ==============================================================================
+#                 معالجة الطلبات في الخلفية (Order Pipeline)
+# ==============================================================================
+# الشراء ينقسم إلى خطوتين:
+#   1. داخل طلب HTTP: التحقق، حجز المخزون، تفريغ السلة، وإعطاء رقم الطلب.
+#   2. في عمال الخلفية: إنشاء الطلب وحفظه وفهرسته (وأي خطوة بطيئة لاحقاً:
+#      فاتورة، إشعار...). الخطوة تُعاد حتى retries مرة عند الخطأ، وإذا فشلت كلها
+#      تُستدعى compensate لتتراجع عن الخطوة الأولى (إعادة المخزون والسلة).
+#
+# الضغط الخلفي: عدد الطلبات المقبولة ولم تكتمل محدود بـ max_pending. الشراء
+# يأخذ مكاناً قبل حجز المخزون (admit) وينتظر مهلة قصيرة إذا امتلأت، ثم يُرفض
+# بدل أن يكبر الطابور بلا حد. drain() عند الإغلاق يكمل كل ما في الطابور.
+#
+# workers=0 ينفذ الخطوة الثانية مباشرة داخل الطلب (السلوك القديم).
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class OrderPipeline:
+    def __init__(self, finalize, workers=2, max_pending=1000, retries=3, history=10000, compensate=None):
+        self._finalize = finalize     # job -> None؛ الاستثناء يعني إعادة المحاولة
+        self._compensate = compensate # job -> رسالة للعميل أو None، بعد فشل كل المحاولات
+        self.workers = workers
+        self.retries = retries
+        self.history = history
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._status = OrderedDict()  # order_id -> {'state', 'customer', 'error'}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+
+    # ----------------------------- القبول -----------------------------
+
+    def admit(self, timeout=0):
+        # مكان في الطابور قبل حجز المخزون؛ False = الخادم مشغول
+        if self._closed:
+            return False
+        return self._slots.acquire(timeout=timeout) if timeout else self._slots.acquire(blocking=False)
+
+    def release(self):
+        # لم يُرسل الطلب بعد القبول (نفد المخزون مثلاً)
+        self._slots.release()
+
+    def submit(self, order_id, customer, job):
+        # يستهلك المكان الذي أخذه admit
+        self._set(order_id, customer, QUEUED)
+        if not self.workers:
+            self._process(order_id, job)
+            return
+        self._start()
+        self._queue.put((order_id, job))
+
+    def recover(self, order_id, customer, job):
+        # طلب بقي معلقاً من تشغيل سابق: يُعالج مباشرة عند الإقلاع (قبل بدء العمال)
+        self._slots.acquire()
+        self._set(order_id, customer, QUEUED)
+        self._process(order_id, job)
+
+    def _start(self):
+        # العمال يبدؤون عند أول طلب (بعد fork في عمال gunicorn)
+        if len(self._threads) < self.workers:
+            with self._lock:
+                while len(self._threads) < self.workers:
+                    thread = threading.Thread(target=self._run, name=f'order-worker-{len(self._threads)}', daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+
+    # ----------------------------- المعالجة -----------------------------
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._process(*item)
+            finally:
+                self._queue.task_done()
+
+    def _process(self, order_id, job):
+        self._set(order_id, None, PROCESSING)
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    self._finalize(job)
+                    break
+                except Exception as e:
+                    if attempt == self.retries:
+                        logger.exception('order %s failed after %d attempts', order_id, attempt + 1)
+                        self._set(order_id, None, FAILED, self._undo(order_id, job) or str(e))
+                        self.failed += 1
+                        return
+                    time.sleep(0.05 * 2 ** attempt)
+            self._set(order_id, None, DONE)
+            self.completed += 1
+        finally:
+            self._slots.release()
+
+    def _undo(self, order_id, job):
+        if self._compensate is None:
+            return None
+        try:
+            return self._compensate(job)
+        except Exception:
+            logger.exception('order %s could not be compensated', order_id)
+            return None
+
+    def _set(self, order_id, customer, state, error=None):
+        with self._lock:
+            entry = self._status.get(order_id)
+            if entry is None:
+                entry = self._status[order_id] = {'state': state, 'customer': customer, 'error': None}
+            entry['state'] = state
+            entry['error'] = error
+            self._status.move_to_end(order_id)
+            # نحتفظ بآخر history حالة؛ الطلبات المكتملة تبقى معروفة من سجل الطلبات
+            while len(self._status) > self.history:
+                oldest, old = next(iter(self._status.items()))
+                if old['state'] in (QUEUED, PROCESSING):
+                    break
+                del self._status[oldest]
+
+    # ----------------------------- الاستعلام -----------------------------
+
+    def status(self, order_id):
+        with self._lock:
+            entry = self._status.get(order_id)
+            return dict(entry) if entry else None
+
+    def join(self):
+        # انتظار اكتمال كل ما في الطابور (للسكربتات والاختبارات)
+        self._queue.join()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queued': self._queue.qsize(),
+            'completed': self.completed,
+            'failed': self.failed,
+        }
+
+    def drain(self, timeout=30.0):
+        # عند الإغلاق: لا طلبات جديدة، ويكتمل كل ما دخل الطابور قبل إغلاق التخزين
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        pending = self._queue.qsize()
+        if pending:
+            logger.warning('order pipeline drained with %d jobs left', pending)
@@ -0,0 +1,336 @@
+import bisect
+import math
+import re
+import threading
+import unicodedata
+
+from facets import iter_positions
+
+# ==============================================================================
+#                     فهرس البحث النصي (Inverted Index)
+# ==============================================================================
+# كل كلمة -> مواقع المنتجات (نفس مواقع ProductCatalog) مقسمة حسب مكان ظهورها:
+#   تصنيف فقط = 1، اسم فقط = 2، الاثنين = 3
+# ترتيب النتائج: مجموع (idf × الوزن) لكل كلمات البحث، ثم ترتيب الإدراج.
+#
+# الاستعلام لا يمشي على المنتجات: كل طبقة تتحول إلى خريطة بتات (int، كما في
+# facets.py) تُحفظ لأكثر الكلمات استعمالاً. البحث بعدة كلمات (AND) يقاطع الطبقات
+# مع بعضها ومع خريطة الفلاتر: كل تركيبة أوزان (3^عدد الكلمات، والفارغ منها يُقطع
+# مبكراً) مجموعة نتائج لها درجة واحدة، فالترتيب ترتيب هذه المجموعات فقط، وداخل
+# المجموعة ترتيب الإدراج كما تعطيه iter_positions. الصفحة تُقرأ بتخطي المجموعات
+# كاملة بـ bit_count حتى offset، فلا يُلمس إلا offset+limit موقع على الأكثر.
+
+CATEGORY_WEIGHT = 1
+NAME_WEIGHT = 2
+BITMAP_CACHE = 128    # عدد الكلمات التي تُحفظ خرائط طبقاتها (الأحدث استعمالاً)
+
+# همزات الألف والمد والتشكيل تسقط مع NFKD + حذف العلامات المركبة،
+# ويبقى توحيد ما لا يتفكك: ٱ ى ة والتطويل والأرقام العربية
+_FOLD = str.maketrans({
+    'ٱ': 'ا', 'ى': 'ي', 'ة': 'ه', 'ـ': None,
+    **{d: str(i) for i, d in enumerate('٠١٢٣٤٥٦٧٨٩')},
+    **{d: str(i) for i, d in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+})
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.translate(_FOLD)
+
+
+def tokenize(text):
+    tokens = []
+    for token in _WORD.findall(normalize(text)):
+        # أداة التعريف: "الحاسوب" و"حاسوب" نفس الكلمة
+        if token.startswith('ال') and len(token) > 3:
+            token = token[2:]
+        tokens.append(token)
+    return tokens
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings = {}   # term -> [مواقع بوزن 1, بوزن 2, بوزن 3] كل قائمة مرتبة
+        self._docs = []       # موقع -> {term: weight} كما فُهرس آخر مرة
+        self._bitmaps = {}    # term -> [int لكل طبقة]؛ تُسقط عند تغير الكلمة
+        self._lock = threading.Lock()
+
+    def update(self, pos, name, category):
+        # تحديث تزايدي: نلمس فقط الكلمات التي تغير وزنها لهذا المنتج
+        terms = {}
+        for token in tokenize(category):
+            terms[token] = CATEGORY_WEIGHT
+        for token in tokenize(name):
+            terms[token] = terms.get(token, 0) | NAME_WEIGHT
+        with self._lock:
+            while len(self._docs) <= pos:
+                self._docs.append(None)
+            old = self._docs[pos] or {}
+            for term, weight in old.items():
+                if terms.get(term) != weight:
+                    self._discard(term, weight, pos)
+            for term, weight in terms.items():
+                if old.get(term) != weight:
+                    tiers = self._postings.setdefault(term, [[], [], []])
+                    bisect.insort(tiers[weight - 1], pos)
+                    self._bitmaps.pop(term, None)
+            # نستبدل القاموس كاملاً فلا يرى البحث الجاري نصف تحديث
+            self._docs[pos] = terms
+
+    def remove(self, pos):
+        with self._lock:
+            if pos < len(self._docs) and self._docs[pos]:
+                for term, weight in self._docs[pos].items():
+                    self._discard(term, weight, pos)
+                self._docs[pos] = None
+
+    def _discard(self, term, weight, pos):
+        tiers = self._postings[term]
+        positions = tiers[weight - 1]
+        i = bisect.bisect_left(positions, pos)
+        if i < len(positions) and positions[i] == pos:
+            del positions[i]
+        self._bitmaps.pop(term, None)
+        if not any(tiers):
+            del self._postings[term]
+
+    def _idf(self, tiers):
+        df = len(tiers[0]) + len(tiers[1]) + len(tiers[2])
+        return math.log(1 + len(self._docs) / df)
+
+    def _tier_bitmaps(self, term):
+        # خرائط بتات الطبقات الثلاث للكلمة؛ تُبنى مرة من القوائم المرتبة وتبقى حتى تتغير
+        with self._lock:
+            bitmaps = self._bitmaps.pop(term, None)
+            if bitmaps is None:
+                bitmaps = []
+                for tier in self._postings.get(term, ((), (), ())):
+                    bits = bytearray((tier[-1] >> 3) + 1 if tier else 0)
+                    for pos in tier:
+                        bits[pos >> 3] |= 1 << (pos & 7)
+                    bitmaps.append(int.from_bytes(bits, 'little'))
+            # إعادة الإدراج تجعلها الأحدث استعمالاً؛ الأقدم يخرج أولاً
+            self._bitmaps[term] = bitmaps
+            while len(self._bitmaps) > BITMAP_CACHE:
+                del self._bitmaps[next(iter(self._bitmaps))]
+        return bitmaps
+
+    def search(self, query, offset=0, limit=24, candidates=None, accept=None):
+        # يعيد (مواقع الصفحة مرتبة بالصلة، إزاحة الصفحة التالية أو None)
+        # candidates: خريطة بتات الفلاتر (FacetIndex.select)؛ None = بلا فلتر
+        # accept: شرط إضافي على الموقع لما لا تغطيه الخرائط (حدود السعر الدقيقة)،
+        # يُطبق فقط على المواقع التي تصلها الصفحة
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return [], None
+        postings = [self._postings.get(t) for t in terms]
+        if not all(postings):
+            return [], None
+        if len(terms) == 1 and candidates is None:
+            # كلمة واحدة بلا فلاتر: الطبقات نفسها هي النتائج مرتبة، دون خرائط
+            return self._page([tier for tier in reversed(postings[0]) if tier], offset, limit, accept)
+        idf = [self._idf(p) for p in postings]
+        tiers = [self._tier_bitmaps(t) for t in terms]
+
+        # مجموعات (درجة، خريطة) لكل تركيبة أوزان غير فارغة؛ نفس الدرجة = مجموعة واحدة
+        groups = {}
+        stack = [(0, 0.0, candidates)]
+        while stack:
+            i, score, bitmap = stack.pop()
+            for weight in (1, 2, 3):
+                tier = tiers[i][weight - 1]
+                hits = tier if bitmap is None else bitmap & tier
+                if not hits:
+                    continue
+                if i + 1 < len(terms):
+                    stack.append((i + 1, score + idf[i] * weight, hits))
+                else:
+                    total = score + idf[i] * weight
+                    groups[total] = groups.get(total, 0) | hits
+
+        return self._page([groups[score] for score in sorted(groups, reverse=True)], offset, limit, accept)
+
+    @staticmethod
+    def _page(groups, offset, limit, accept):
+        # groups بترتيب الصلة، كل منها خريطة بتات أو قائمة مواقع مرتبة
+        page = []
+        skipped = 0
+        for group in groups:
+            bitmap = isinstance(group, int)
+            if accept is None:
+                size = group.bit_count() if bitmap else len(group)
+                if skipped + size <= offset:
+                    skipped += size
+                    continue
+            for pos in iter_positions(group) if bitmap else group:
+                if accept is not None and not accept(pos):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                if len(page) == limit:
+                    return page, offset + limit
+                page.append(pos)
+        return page, None
+
+
+# ==============================================================================
+#                  الإكمال التلقائي (Typeahead) حسب المبيعات
+# ==============================================================================
+# شجرة بادئات (trie) على بدايات كلمات الاسم: "Cotton T-Shirt" يظهر عند كتابة
+# "cot" أو "t-s" أو "shi". كل عقدة تحفظ أفضل k منتجات في فرعها مرتبة بالقطع المباعة،
+# فالاستعلام مشي على حروف البادئة وقراءة القائمة الجاهزة دون لمس الكتالوج.
+# الأوراق سلال (burst trie): تجمع حتى BURST مفتاحاً ولا تتفرع إلا إذا امتلأت،
+# فالأسماء ذات النهايات الفريدة لا تبني سلسلة عقد لكل حرف. البادئة التي تنتهي
+# داخل سلة تُفلتر على مفاتيحها القليلة. العمق محدود بـ max_depth.
+
+BURST = 32
+
+
+class _Node:
+    __slots__ = ('children', 'top', 'ends')
+
+    def __init__(self):
+        self.children = None   # None = سلة لم تتفرع بعد
+        self.top = []          # أفضل k معرفات منتجات في الفرع
+        self.ends = []         # (المفتاح كاملاً، المعرف): في السلة كل مفاتيح الفرع،
+                               # وفي العقدة المتفرعة المفاتيح التي تنتهي عندها فقط
+
+
+class Typeahead:
+    def __init__(self, k=10, max_depth=12):
+        self.k = k
+        self.max_depth = max_depth
+        self._root = _Node()
+        self._root.children = {}
+        self._sold = {}       # product_id -> القطع المباعة
+        self._keys = {}       # product_id -> المفاتيح المفهرسة حالياً
+        self._names = {}      # product_id -> الاسم المعروض
+        self._lock = threading.Lock()
+
+    def _rank(self, p_id):
+        return -self._sold.get(p_id, 0), p_id
+
+    @staticmethod
+    def _name_keys(name):
+        text = ' '.join(normalize(name).split())
+        return {text[m.start():] for m in _WORD.finditer(text)}
+
+    def update(self, p_id, name):
+        # عند إضافة منتج أو تغيير اسمه
+        keys = self._name_keys(name)
+        with self._lock:
+            self._names[p_id] = name
+            old = self._keys.get(p_id, set())
+            for key in old - keys:
+                self._remove_key(key, p_id)
+            for key in keys - old:
+                self._add_key(key, p_id)
+            self._keys[p_id] = keys
+
+    def add_sales(self, p_id, qty):
+        # المبيعات تزيد فقط، فيكفي رفع المنتج في قوائم العقد على مساراته
+        with self._lock:
+            self._sold[p_id] = self._sold.get(p_id, 0) + qty
+            for key in self._keys.get(p_id, ()):
+                for node in self._path(key):
+                    self._promote(node, p_id)
+
+    def sold(self, p_id):
+        return self._sold.get(p_id, 0)
+
+    def suggest(self, prefix, k=None):
+        # يعيد [(product_id, الاسم)] لأفضل k منتجات تبدأ إحدى كلمات اسمها بالبادئة
+        k = min(k or self.k, self.k)
+        prefix = ' '.join(normalize(prefix).split())
+        if not prefix:
+            return []
+        node = self._root
+        depth = 0
+        for ch in prefix:
+            if node.children is None:
+                break
+            node = node.children.get(ch)
+            if node is None:
+                return []
+            depth += 1
+        if depth == len(prefix):
+            ids = node.top[:k]
+        else:
+            ids = sorted({p_id for key, p_id in list(node.ends) if key.startswith(prefix)}, key=self._rank)[:k]
+        names = self._names
+        return [(p_id, names[p_id]) for p_id in ids if p_id in names]
+
+    def _path(self, key):
+        # العقد من الجذر حتى العقدة التي يُحفظ فيها المفتاح (سلة أو نهاية المفتاح)
+        node = self._root
+        nodes = [node]
+        for ch in key:
+            if node.children is None:
+                break
+            node = node.children.get(ch)
+            if node is None:
+                break
+            nodes.append(node)
+        return nodes
+
+    def _add_key(self, key, p_id):
+        node = self._root
+        depth = 0
+        while True:
+            self._promote(node, p_id)
+            if node.children is None:
+                node.ends.append((key, p_id))
+                if len(node.ends) > BURST and depth < self.max_depth:
+                    self._burst(node, depth)
+                return
+            if depth == len(key):
+                node.ends.append((key, p_id))
+                return
+            child = node.children.get(key[depth])
+            if child is None:
+                child = node.children[key[depth]] = _Node()
+            node = child
+            depth += 1
+
+    def _burst(self, node, depth):
+        # توزيع مفاتيح السلة على أبناء بالحرف التالي؛ قائمة العقدة نفسها لا تتغير
+        entries = node.ends
+        children = {}
+        node.ends = []
+        for key, p_id in entries:
+            if len(key) == depth:
+                node.ends.append((key, p_id))
+            else:
+                child = children.get(key[depth])
+                if child is None:
+                    child = children[key[depth]] = _Node()
+                child.ends.append((key, p_id))
+        for child in children.values():
+            child.top = sorted({p_id for _, p_id in child.ends}, key=self._rank)[:self.k]
+            if len(child.ends) > BURST and depth + 1 < self.max_depth:
+                self._burst(child, depth + 1)
+        node.children = children
+
+    def _remove_key(self, key, p_id):
+        nodes = self._path(key)
+        nodes[-1].ends.remove((key, p_id))
+        # نعيد حساب القوائم من الأسفل للأعلى ونتوقف عند أول عقدة لم يكن المنتج فيها
+        for node in reversed(nodes):
+            if p_id not in node.top:
+                break
+            candidates = {i for _, i in node.ends}
+            for child in (node.children or {}).values():
+                candidates.update(child.top)
+            node.top = sorted(candidates, key=self._rank)[:self.k]
+
+    def _promote(self, node, p_id):
+        top = node.top
+        if p_id in top:
+            top.remove(p_id)
+        elif len(top) >= self.k and self._rank(p_id) >= self._rank(top[-1]):
+            return
+        bisect.insort(top, p_id, key=self._rank)
+        del top[self.k:]
@@ -64,3 +64,24 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+
+// التحديثات الحية للمخزون والعروض (/api/stream)
+// lastEventId: رقم آخر حدث وقت عرض الصفحة، فلا يضيع ما تغير قبل فتح الاتصال
+// إذا رد الخادم 204 (اكتمل عدد اتصالات البث في العامل) يُغلق المتصفح الاتصال
+// ولا يعيده، فنحاول مرة أخرى بعد LIVE_RETRY_MS من آخر حدث وصل
+const LIVE_RETRY_MS = 60000;
+
+function subscribeLiveUpdates(lastEventId, handlers) {
+    if (!window.EventSource) return null;
+    const source = new EventSource('/api/stream?last_event_id=' + encodeURIComponent(lastEventId || ''));
+    const track = e => { if (e.lastEventId) lastEventId = e.lastEventId; };
+    source.addEventListener('products', e => { track(e); handlers.products(JSON.parse(e.data)); });
+    source.addEventListener('reset', e => { track(e); handlers.reset && handlers.reset(); });
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            setTimeout(() => subscribeLiveUpdates(lastEventId, handlers), LIVE_RETRY_MS);
+        }
+    });
+    return source;
+}
+
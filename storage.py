@@ -0,0 +1,378 @@
+import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+# ==============================================================================
+#                      طبقة التخزين (Storage Backends)
+# ==============================================================================
+# الحالة تنتقل بين ShopSystem والتخزين كصفوف (dict) بالشكل:
+#   {'rev': int, 'products': [...], 'users': [...], 'orders': [...]}
+# صف المستخدم يحمل سلته: 'cart': [[product_id, qty], ...]
+
+
+class MemoryStorage:
+    # التخزين في ذاكرة العملية (السلوك الأصلي): لا حفظ ولا مشاركة بين العمليات
+    shared = False
+
+    def __init__(self):
+        self._counters = {}       # اسم العداد -> أول رقم لم يُعط بعد
+        self._counters_lock = threading.Lock()
+
+    def load(self):
+        return None
+
+    def seed(self, state):
+        return None
+
+    def changes(self, rev):
+        return None
+
+    def bind(self, export_state):
+        pass
+
+    @contextmanager
+    def batch(self, label=None):
+        yield
+
+    def add_user(self, row):
+        return True
+
+    def save_cart(self, username, lines):
+        pass
+
+    def update_product(self, p_id, fields):
+        pass
+
+    def update_products(self, updates):
+        pass
+
+    def upsert_products(self, rows):
+        pass
+
+    def reserve_stock(self, lines):
+        return None
+
+    def release_stock(self, lines):
+        return None
+
+    def add_pending_order(self, row):
+        pass
+
+    def cancel_pending_order(self, order_id):
+        return True
+
+    def add_order(self, row):
+        return True
+
+    def allocate_ids(self, name, count, floor=1):
+        # كتلة أرقام [start, start + count) من عداد لا يرجع للخلف؛ floor لبيانات أقدم من العداد
+        with self._counters_lock:
+            start = max(self._counters.get(name, 1), floor)
+            self._counters[name] = start + count
+        return start
+
+    def close(self):
+        pass
+
+
+class _ConnectionPool:
+    def __init__(self, factory, size):
+        self._factory = factory
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._factory()
+        try:
+            yield conn
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('rev', 0), ('seeded', 0);
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY, name TEXT NOT NULL, price NOT NULL, stock INTEGER NOT NULL,
+    category TEXT NOT NULL, offer_discount NOT NULL DEFAULT 0, offer_gift TEXT,
+    offer_limit INTEGER NOT NULL DEFAULT 0, rev INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_rev ON products (rev);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY, password TEXT NOT NULL, role TEXT NOT NULL,
+    cart TEXT NOT NULL DEFAULT '[]', rev INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_rev ON users (rev);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INTEGER PRIMARY KEY, customer TEXT NOT NULL, items TEXT NOT NULL, total REAL NOT NULL,
+    address TEXT, pay_method TEXT, pay_status TEXT, date TEXT NOT NULL, rev INTEGER NOT NULL,
+    lines TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS orders_rev ON orders (rev);
+CREATE TABLE IF NOT EXISTS pending_orders (order_id INTEGER PRIMARY KEY, row TEXT NOT NULL);
+"""
+
+_PRODUCT_COLUMNS = ('id', 'name', 'price', 'stock', 'category', 'offer_discount', 'offer_gift', 'offer_limit')
+_ORDER_COLUMNS = ('order_id', 'customer', 'items', 'total', 'address', 'pay_method', 'pay_status', 'date', 'lines')
+_JSON_COLUMNS = ('items', 'lines')
+
+
+class SQLiteStorage:
+    # قاعدة SQLite مدمجة بوضع WAL: عدة عمليات gunicorn تقرأ وتكتب نفس الحالة
+    # كل كتابة ترفع العداد 'rev' وتختم الصفوف المتغيرة به، فتلتقط كل عملية
+    # تغييرات غيرها عبر changes(rev) في بداية كل طلب
+    shared = True
+
+    def __init__(self, path, pool_size=4, timeout=30.0):
+        self.path = path
+        self._timeout = timeout
+        self._pool = _ConnectionPool(self._connect, pool_size)
+        self._local = threading.local()
+        with self._pool.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # قواعد أُنشئت قبل إضافة أسطر الطلب (product_id, qty)
+            columns = [r['name'] for r in conn.execute("PRAGMA table_info(orders)")]
+            if 'lines' not in columns:
+                conn.execute("ALTER TABLE orders ADD COLUMN lines TEXT NOT NULL DEFAULT '[]'")
+
+    def _connect(self):
+        # استيراد مؤجل: الوضع الافتراضي (memory) لا يحتاج sqlite3 أثناء الإقلاع
+        import sqlite3
+        conn = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self._timeout * 1000)}")
+        return conn
+
+    # ----------------------------- المعاملات -----------------------------
+
+    @contextmanager
+    def _write(self):
+        # داخل batch() نعيد استخدام نفس المعاملة ونفس رقم المراجعة
+        current = getattr(self._local, 'tx', None)
+        if current is not None:
+            yield current
+            return
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'rev'")
+                rev = conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+                self._local.tx = (conn, rev)
+                yield self._local.tx
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.tx = None
+
+    @contextmanager
+    def batch(self, label=None):
+        with self._write():
+            yield
+
+    def bind(self, export_state):
+        pass
+
+    # ----------------------------- القراءة -----------------------------
+
+    def load(self):
+        with self._pool.connection() as conn:
+            seeded = conn.execute("SELECT value FROM meta WHERE key = 'seeded'").fetchone()[0]
+        if not seeded:
+            return None
+        state = self.changes(-1)
+        # طلبات حُجز مخزونها ولم تُنشأ بعد (توقفت العملية قبل معالجتها مثلاً)
+        with self._pool.connection() as conn:
+            state['pending'] = [json.loads(r['row']) for r in conn.execute("SELECT row FROM pending_orders")]
+        return state
+
+    def seed(self, state):
+        # أول عملية تصل تزرع البيانات، والبقية تقرأ ما زرعته
+        with self._write() as (conn, rev):
+            seeded = conn.execute("SELECT value FROM meta WHERE key = 'seeded'").fetchone()[0]
+            if not seeded:
+                conn.executemany(
+                    "INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [tuple(row[c] for c in _PRODUCT_COLUMNS) + (rev,) for row in state['products']])
+                conn.executemany(
+                    "INSERT INTO users VALUES (?, ?, ?, ?, ?)",
+                    [(row['username'], row['password'], row['role'], json.dumps(row['cart']), rev)
+                     for row in state['users']])
+                conn.execute("UPDATE meta SET value = 1 WHERE key = 'seeded'")
+        return self.load()
+
+    def changes(self, rev):
+        with self._pool.connection() as conn:
+            current = conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+            if current == rev:
+                return None
+            conn.execute("BEGIN")
+            try:
+                current = conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+                products = conn.execute(
+                    f"SELECT {', '.join(_PRODUCT_COLUMNS)} FROM products WHERE rev > ? ORDER BY id", (rev,)).fetchall()
+                users = conn.execute(
+                    "SELECT username, password, role, cart FROM users WHERE rev > ?", (rev,)).fetchall()
+                orders = conn.execute(
+                    f"SELECT {', '.join(_ORDER_COLUMNS)} FROM orders WHERE rev > ? ORDER BY order_id", (rev,)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+        return {
+            'rev': current,
+            'products': [dict(r) for r in products],
+            'users': [dict(r, cart=json.loads(r['cart'])) for r in users],
+            'orders': [dict(r, items=json.loads(r['items']), lines=json.loads(r['lines'])) for r in orders],
+        }
+
+    # ----------------------------- الكتابة -----------------------------
+
+    def add_user(self, row):
+        with self._write() as (conn, rev):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?, ?)",
+                (row['username'], row['password'], row['role'], json.dumps(row['cart']), rev))
+            return cur.rowcount == 1
+
+    def save_cart(self, username, lines):
+        with self._write() as (conn, rev):
+            conn.execute("UPDATE users SET cart = ?, rev = ? WHERE username = ?", (json.dumps(lines), rev, username))
+
+    def update_product(self, p_id, fields):
+        if not fields:
+            return
+        columns = [c for c in fields if c in _PRODUCT_COLUMNS and c != 'id']
+        assignments = ', '.join(f"{c} = ?" for c in columns)
+        with self._write() as (conn, rev):
+            conn.execute(f"UPDATE products SET {assignments}, rev = ? WHERE id = ?",
+                         [fields[c] for c in columns] + [rev, p_id])
+
+    def update_products(self, updates):
+        # تعديلات جماعية [(p_id, fields), ...]: executemany لكل مجموعة أعمدة في معاملة واحدة
+        groups = {}
+        for p_id, fields in updates:
+            columns = tuple(c for c in fields if c in _PRODUCT_COLUMNS and c != 'id')
+            if columns:
+                groups.setdefault(columns, []).append((p_id, fields))
+        if not groups:
+            return
+        with self._write() as (conn, rev):
+            for columns, rows in groups.items():
+                assignments = ', '.join(f"{c} = ?" for c in columns)
+                conn.executemany(f"UPDATE products SET {assignments}, rev = ? WHERE id = ?",
+                                 [[fields[c] for c in columns] + [rev, p_id] for p_id, fields in rows])
+
+    def upsert_products(self, rows):
+        # استيراد: صفوف كاملة، تُضاف الجديدة وتُستبدل الموجودة
+        if not rows:
+            return
+        columns = ', '.join(_PRODUCT_COLUMNS)
+        updates = ', '.join(f"{c} = excluded.{c}" for c in _PRODUCT_COLUMNS if c != 'id')
+        with self._write() as (conn, rev):
+            conn.executemany(
+                f"INSERT INTO products ({columns}, rev) VALUES ({', '.join('?' * len(_PRODUCT_COLUMNS))}, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET {updates}, rev = excluded.rev",
+                [tuple(row[c] for c in _PRODUCT_COLUMNS) + (rev,) for row in rows])
+
+    def reserve_stock(self, lines):
+        # خصم ذري لكل الأصناف أو لا شيء؛ يعيد المخزون الجديد أو None عند النفاد
+        with self._write() as (conn, rev):
+            conn.execute("SAVEPOINT reserve")
+            for p_id, qty in lines:
+                cur = conn.execute(
+                    "UPDATE products SET stock = stock - ?, rev = ? WHERE id = ? AND stock >= ?",
+                    (qty, rev, p_id, qty))
+                if cur.rowcount != 1:
+                    conn.execute("ROLLBACK TO reserve")
+                    conn.execute("RELEASE reserve")
+                    return None
+            conn.execute("RELEASE reserve")
+            placeholders = ', '.join('?' * len(lines))
+            rows = conn.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders})",
+                                [p_id for p_id, _ in lines]).fetchall()
+            return {r['id']: r['stock'] for r in rows}
+
+    def release_stock(self, lines):
+        # إعادة مخزون حُجز لطلب أُلغي؛ يعيد المخزون الجديد
+        with self._write() as (conn, rev):
+            conn.executemany("UPDATE products SET stock = stock + ?, rev = ? WHERE id = ?",
+                             [(qty, rev, p_id) for p_id, qty in lines])
+            placeholders = ', '.join('?' * len(lines))
+            rows = conn.execute(f"SELECT id, stock FROM products WHERE id IN ({placeholders})",
+                                [p_id for p_id, _ in lines]).fetchall()
+            return {r['id']: r['stock'] for r in rows}
+
+    def add_pending_order(self, row):
+        with self._write() as (conn, rev):
+            conn.execute("INSERT INTO pending_orders VALUES (?, ?)", (row['order_id'], json.dumps(row)))
+
+    def cancel_pending_order(self, order_id):
+        # حذف الصف هو "المطالبة" بالطلب: عملية واحدة فقط تنشئه أو تلغيه
+        with self._write() as (conn, rev):
+            cur = conn.execute("DELETE FROM pending_orders WHERE order_id = ?", (order_id,))
+            return cur.rowcount == 1
+
+    def add_order(self, row):
+        # False إذا أُلغي الطلب المعلق في عملية أخرى (أعيد مخزونه)
+        with self._write() as (conn, rev):
+            cur = conn.execute("DELETE FROM pending_orders WHERE order_id = ?", (row['order_id'],))
+            if cur.rowcount == 0:
+                # أنشأته عملية أخرى استرجعت الطلبات المعلقة، أو ألغته
+                return conn.execute("SELECT 1 FROM orders WHERE order_id = ?", (row['order_id'],)).fetchone() is not None
+            values = [json.dumps(row[c]) if c in _JSON_COLUMNS else row[c] for c in _ORDER_COLUMNS]
+            conn.execute(f"INSERT INTO orders ({', '.join(_ORDER_COLUMNS)}, rev) VALUES ({', '.join('?' * len(values))}, ?)",
+                         values + [rev])
+            return True
+
+    def allocate_ids(self, name, count, floor=1):
+        # العداد في meta ومعاملته مستقلة: كتلة أُعطيت لا تعود مع تراجع دفعة أخرى،
+        # لذلك لا يُستدعى داخل batch() (كانت ستشارك معاملتها أو تنتظر قفلها)
+        if getattr(self._local, 'tx', None) is not None:
+            raise RuntimeError("allocate_ids cannot run inside a batch")
+        key = f'ids:{name}'
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, 1)", (key,))
+                start = max(conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0], floor)
+                conn.execute("UPDATE meta SET value = ? WHERE key = ?", (start + count, key))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return start
+
+    def close(self):
+        self._pool.close()
+
+
+def create_storage(kind=None):
+    kind = kind or os.environ.get('SHOP_STORAGE', 'memory')
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'sqlite':
+        return SQLiteStorage(os.environ.get('SHOP_DB_PATH', 'shop.db'),
+                             pool_size=int(os.environ.get('SHOP_DB_POOL', 4)))
+    if kind == 'journal':
+        from journal import JournalStorage
+        return JournalStorage(os.environ.get('SHOP_JOURNAL_DIR', 'data'),
+                              snapshot_every=int(os.environ.get('SHOP_SNAPSHOT_EVERY', 10000)),
+                              snapshot_interval=float(os.environ.get('SHOP_SNAPSHOT_INTERVAL', 60)))
+    raise ValueError(f"Unknown SHOP_STORAGE backend: {kind}")